@@ -0,0 +1,48 @@
+"""Per-request auth overhead: decode + list scans vs. cached claims + subset check.
+
+Runs the dependency bodies directly, without HTTP, for a route requiring two
+permissions. Needs the usual ``.env`` (``SECRET_KEY`` etc.).
+
+    python -m benchmarks.bench_auth
+"""
+
+from __future__ import annotations
+
+import timeit
+
+import jwt
+
+from src.models import ADMIN_ACCESS, Access
+from src.utils.auth import ALGORITHM, SECRET_KEY, Authentication
+
+REQUIRED = (Access.UPDATE_STAFF, Access.READ_STAFF)
+ROUNDS = 20_000
+
+
+def legacy_request(token: str):
+    # Before: one decode per Depends(access_required(...)), each scanning a list.
+    for required in REQUIRED:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if required.value not in payload["access"]:
+            raise PermissionError
+
+
+def cached_request(token: str, dependency):
+    dependency(token)
+
+
+def main():
+    token = Authentication.encode(
+        {"_id": "bench-admin", "role": "admin", "email_address": "bench@example.com"}, *ADMIN_ACCESS
+    )
+    dependency = Authentication.access_required(*REQUIRED)
+
+    legacy = timeit.timeit(lambda: legacy_request(token), number=ROUNDS)
+    cached = timeit.timeit(lambda: cached_request(token, dependency), number=ROUNDS)
+
+    print(f"legacy: {legacy / ROUNDS * 1e6:8.2f} us/request")
+    print(f"cached: {cached / ROUNDS * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Booking latency as a doctor's appointment history grows.
+
+Seeds a scratch database with N past appointments for one doctor and times
+the overlap check + insert done by ``/appointment/create`` against the old
+scan-everything loop. Needs the usual ``.env`` (``MONGODB_URI`` etc.).
+
+    python -m benchmarks.bench_booking
+"""
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from src.app import mongo_client
+from src.models import Appointment
+from src.utils.booking import CONFLICT_INDEX, find_conflicting_appointment
+
+HISTORY_SIZES = [100, 1_000, 10_000, 50_000]
+PROBES = 200
+DOCTOR_ID = "bench-doctor"
+
+
+def make_appointment(start: datetime) -> dict:
+    return {
+        "_id": str(uuid.uuid4()),
+        "patient_id": "bench-patient",
+        "doctor_id": DOCTOR_ID,
+        "start_date": start,
+        "end_date": start + timedelta(minutes=30),
+        "status": "Completed",
+        "created_at": start,
+    }
+
+
+async def legacy_check(collection, start_date: datetime, end_date: datetime) -> bool:
+    async for data in collection.find({"doctor_id": DOCTOR_ID}):
+        existing = Appointment(**data)
+        if start_date < existing.end_date and end_date > existing.start_date:
+            return True
+    return False
+
+
+async def indexed_check(collection, start_date: datetime, end_date: datetime) -> bool:
+    return await find_conflicting_appointment(
+        collection, DOCTOR_ID, start_date, end_date
+    ) is not None
+
+
+async def time_bookings(collection, check, probes: int) -> list[float]:
+    origin = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    timings = []
+    for i in range(probes):
+        appointment = make_appointment(origin + timedelta(hours=i))
+        appointment["status"] = "Confirmed"
+
+        started = time.perf_counter()
+        if not await check(collection, appointment["start_date"], appointment["end_date"]):
+            await collection.insert_one(appointment)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    await collection.delete_many({"start_date": {"$gte": origin}})
+    return timings
+
+
+async def main():
+    database = mongo_client["HMS_bench"]
+    collection = database["appointments"]
+
+    print(f"{'history':>8} {'indexed p50':>12} {'indexed p99':>12} {'legacy p50':>11}")
+    for size in HISTORY_SIZES:
+        await collection.drop()
+        await collection.create_index(CONFLICT_INDEX)
+        origin = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        documents = [make_appointment(origin + timedelta(hours=i)) for i in range(size)]
+        for offset in range(0, size, 5_000):
+            await collection.insert_many(documents[offset : offset + 5_000])
+
+        indexed = await time_bookings(collection, indexed_check, PROBES)
+        legacy = await time_bookings(collection, legacy_check, max(PROBES // 20, 5))
+
+        print(
+            f"{size:>8} {statistics.median(indexed):>10.2f}ms "
+            f"{statistics.quantiles(indexed, n=100)[98]:>10.2f}ms "
+            f"{statistics.median(legacy):>9.2f}ms"
+        )
+
+    await mongo_client.drop_database("HMS_bench")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Event-loop latency of unrelated work during a burst of bcrypt logins.
+
+A probe coroutine stands in for an unrelated endpoint and measures how late
+the loop schedules it while LOGINS password checks run, first inline on the
+loop (what plain bcrypt in a handler would do) and then through the process
+pool used by authenticate_user. Needs the usual ``.env``.
+
+    python -m benchmarks.bench_login_storm
+"""
+
+from __future__ import annotations
+
+import asyncio
+import statistics
+import time
+
+from src.utils.passwords import (
+    BCRYPT_ROUNDS,
+    _check,
+    _hash,
+    shutdown_password_pool,
+    verify_password,
+)
+
+LOGINS = 64
+PROBE_INTERVAL = 0.005
+
+
+async def probe(latencies: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        latencies.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def inline_login(password: str, hashed: str) -> bool:
+    return _check(password, hashed)
+
+
+async def storm(login, hashed: str) -> list[float]:
+    latencies: list[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(latencies, stop))
+
+    await asyncio.gather(*(login("correct horse", hashed) for _ in range(LOGINS)))
+
+    stop.set()
+    await probe_task
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    p99 = statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else latencies[0]
+    print(f"{name:>8}: probes={len(latencies):5d} p50={statistics.median(latencies):8.2f}ms p99={p99:8.2f}ms")
+
+
+async def main():
+    hashed = _hash("correct horse", BCRYPT_ROUNDS)
+    await verify_password("correct horse", hashed)  # start the pool workers
+
+    report("inline", await storm(inline_login, hashed))
+    report("pooled", await storm(verify_password, hashed))
+    shutdown_password_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,6 +7,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, GEOSPHERE
 
 from razorpay import Client as Client
 
@@ -18,7 +19,7 @@ URI = os.getenv("MONGODB_URI")
 if URI is None:
     raise ValueError("MONGODB_URI is not set")
 
-mongo_client = AsyncIOMotorClient(URI, document_class=dict)
+mongo_client = AsyncIOMotorClient(URI, document_class=dict, tz_aware=True)
 database = mongo_client["HMS"]
 
 RAZORPAY_KEY = os.getenv("RAZORPAY_KEY")
@@ -57,4 +58,49 @@ app.add_middleware(
     allowed_hosts=["*"],
 )
 
+
+@app.on_event("startup")
+async def create_indexes():
+    # Overlap checks; see CONFLICT_INDEX in src/utils/booking.py.
+    await database["appointments"].create_index(
+        [("doctor_id", ASCENDING), ("end_date", ASCENDING), ("start_date", ASCENDING)]
+    )
+    await database["appointments"].create_index(
+        [("patient_id", ASCENDING), ("start_date", ASCENDING), ("_id", ASCENDING)]
+    )
+    await database["appointments"].create_index(
+        [("doctor_id", ASCENDING), ("start_date", ASCENDING), ("_id", ASCENDING)]
+    )
+    await database["users"].create_index("hospital_id")
+    try:
+        await database["users"].create_index(
+            [("email_address", ASCENDING), ("role", ASCENDING)], unique=True
+        )
+    except Exception as e:
+        # Existing duplicate accounts block the unique index; fall back to a plain one.
+        print(f"Unique (email_address, role) index not created: {e}")
+        await database["users"].create_index(
+            [("email_address", ASCENDING), ("role", ASCENDING)]
+        )
+    await database["appointment_slots"].create_index(
+        [("doctor_id", ASCENDING), ("slot", ASCENDING)], unique=True
+    )
+    await database["appointment_slots"].create_index("appointment_id")
+    await database["email_outbox"].create_index(
+        [("status", ASCENDING), ("next_attempt_at", ASCENDING)]
+    )
+    await database["email_outbox"].create_index("claim")
+    await database["email_outbox"].create_index("sent_at", expireAfterSeconds=7 * 24 * 3600)
+    await database["hospitals"].create_index([("location", GEOSPHERE)])
+    await database["otps"].create_index("expires_at", expireAfterSeconds=0)
+    await database["rate_limits"].create_index("expires_at", expireAfterSeconds=0)
+    await database["rollups"].create_index(
+        [("hospital_id", ASCENDING), ("day", ASCENDING), ("doctor_id", ASCENDING)],
+        unique=True,
+    )
+    await database["pending_orders"].create_index(
+        "created_at", expireAfterSeconds=int(os.getenv("PENDING_ORDER_TTL", 24 * 3600))
+    )
+
+
 from .routes import *  # noqa: E402, F401, F403
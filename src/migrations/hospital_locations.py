@@ -0,0 +1,33 @@
+"""Backfill the GeoJSON `location` point on hospitals from latitude/longitude.
+
+Only hospitals without a location and with in-range coordinates are touched,
+so the command is safe to re-run.
+
+    python -m src.migrations.hospital_locations
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from src.app import database
+
+
+async def main():
+    result = await database["hospitals"].update_many(
+        {
+            "location": {"$exists": False},
+            "latitude": {"$gte": -90, "$lte": 90},
+            "longitude": {"$gte": -180, "$lte": 180},
+        },
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}],
+    )
+    print(f"hospitals: {result.modified_count} locations backfilled")
+
+    missing = await database["hospitals"].count_documents({"location": {"$exists": False}})
+    if missing:
+        print(f"hospitals: {missing} without valid coordinates left unlocated")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
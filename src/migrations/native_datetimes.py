@@ -0,0 +1,94 @@
+"""Convert legacy "%Y-%m-%dT%H:%M:%SZ" string fields to native BSON dates.
+
+Batched and resumable: progress is checkpointed per collection in the
+`migrations` collection, and only documents still holding string values are
+selected, so the command can be interrupted and re-run at any time.
+
+    python -m src.migrations.native_datetimes [--batch-size 500] [--restart]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+from pymongo import UpdateOne
+
+from src.app import database
+from src.utils.booking import parse_date
+
+FIELDS = {
+    "appointments": ["start_date", "end_date", "created_at"],
+    "leave_requests": ["created_at", "dates"],
+    "appointment_slots": ["slot"],
+}
+
+
+def convert(value):
+    if isinstance(value, str):
+        return parse_date(value)
+    if isinstance(value, list):
+        return [convert(item) for item in value]
+    return value
+
+
+async def migrate_collection(name: str, fields: list[str], batch_size: int, restart: bool):
+    collection = database[name]
+    checkpoints = database["migrations"]
+    checkpoint_id = f"native_datetimes:{name}"
+
+    checkpoint = None if restart else await checkpoints.find_one({"_id": checkpoint_id})
+    last_id = checkpoint["last_id"] if checkpoint else None
+
+    # `dates` is an array; $type matches if any element is a string.
+    query: dict = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    converted = 0
+
+    while True:
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = (
+            await collection.find(query, {field: 1 for field in fields})
+            .sort("_id", 1)
+            .to_list(batch_size)
+        )
+        if not batch:
+            break
+
+        operations = []
+        for document in batch:
+            try:
+                update = {field: convert(document[field]) for field in fields if field in document}
+            except ValueError as e:
+                print(f"{name}/{document['_id']}: skipped, {e}")
+                continue
+            operations.append(UpdateOne({"_id": document["_id"]}, {"$set": update}))
+
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+
+        converted += len(operations)
+        last_id = batch[-1]["_id"]
+        await checkpoints.update_one(
+            {"_id": checkpoint_id}, {"$set": {"last_id": last_id}}, upsert=True
+        )
+        print(f"{name}: {converted} documents converted")
+
+    await checkpoints.update_one(
+        {"_id": checkpoint_id}, {"$set": {"last_id": None, "done": True}}, upsert=True
+    )
+
+
+async def main(batch_size: int, restart: bool):
+    for name, fields in FIELDS.items():
+        await migrate_collection(name, fields, batch_size, restart)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    arguments = parser.parse_args()
+
+    asyncio.run(main(arguments.batch_size, arguments.restart))
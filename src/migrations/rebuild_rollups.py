@@ -0,0 +1,13 @@
+"""Recompute the `rollups` collection from scratch out of `appointments`.
+
+    python -m src.migrations.rebuild_rollups
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from src.utils.rollups import rebuild_rollups
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_rollups())
@@ -0,0 +1,69 @@
+"""Reserve `appointment_slots` rows for bookings made before slots existed.
+
+Only active appointments that have not ended yet and hold no slot rows are
+touched, so the command is safe to re-run. Legacy bookings that do not sit on
+a slot boundary reserve every bucket they overlap. Bookings that clash with a
+slot already taken are reported and left for staff to resolve.
+
+    python -m src.migrations.reserve_slots
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING
+
+from src.app import database
+from src.utils.booking import INACTIVE_STATUSES, SLOT_MINUTES, as_datetime, reserve_slots
+
+
+def widen(start_date: datetime, end_date: datetime) -> tuple[datetime, datetime]:
+    step = SLOT_MINUTES * 60
+    start = start_date.timestamp() // step * step
+    end = -(-end_date.timestamp() // step) * step
+    return datetime.fromtimestamp(start, timezone.utc), datetime.fromtimestamp(end, timezone.utc)
+
+
+async def main():
+    slots = database["appointment_slots"]
+    await slots.create_index([("doctor_id", ASCENDING), ("slot", ASCENDING)], unique=True)
+    await slots.create_index("appointment_id")
+
+    now = datetime.now(timezone.utc)
+    reserved = skipped = 0
+    clashes = []
+    async for appointment in database["appointments"].find(
+        {
+            "doctor_id": {"$nin": ["", None]},
+            "cancelled": {"$ne": True},
+            "status": {"$nin": INACTIVE_STATUSES},
+        },
+        {"doctor_id": 1, "start_date": 1, "end_date": 1},
+    ):
+        # Not filtered in the query: dates may still be strings until
+        # native_datetimes has run.
+        start_date, end_date = widen(
+            as_datetime(appointment["start_date"]), as_datetime(appointment["end_date"])
+        )
+        if end_date <= now or start_date >= end_date:
+            continue
+        if await slots.find_one({"appointment_id": appointment["_id"]}, {"_id": 1}):
+            skipped += 1
+            continue
+
+        if await reserve_slots(
+            slots, appointment["doctor_id"], start_date, end_date, appointment["_id"]
+        ):
+            reserved += 1
+        else:
+            clashes.append(appointment["_id"])
+
+    print(f"appointments: {reserved} reserved, {skipped} already reserved")
+    if clashes:
+        print(f"appointments: {len(clashes)} overlap another booking: {', '.join(map(str, clashes))}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
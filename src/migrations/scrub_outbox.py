@@ -0,0 +1,31 @@
+"""Blank the bodies of already settled credential-bearing outbox messages.
+
+The worker clears a sensitive message's body once it is sent or dead; this
+does the same for messages settled before that. Account-created mail queued
+before the `sensitive` flag existed is recognised by its subject. Other
+messages keep their bodies, so dead letters can still be replayed.
+
+    python -m src.migrations.scrub_outbox
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from src.app import database
+
+
+async def main():
+    result = await database["email_outbox"].update_many(
+        {
+            "status": {"$in": ["sent", "dead"]},
+            "$or": [{"sensitive": True}, {"subject": "Account Created"}],
+            "body": {"$ne": ""},
+        },
+        {"$set": {"body": ""}},
+    )
+    print(f"email_outbox: {result.modified_count} bodies blanked")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
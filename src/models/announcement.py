@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import uuid
 
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, Field
 from typing import List
 
+from .appointment import UTCDateTime
 from .enums import AnnouncementCategory
 
 
@@ -17,9 +18,18 @@ class Announcement(BaseModel):
 
 
 class LeaveRequest(BaseModel):
-    id: str = str(uuid.uuid4())
+    id: str = Field(
+        default_factory=lambda: str(uuid.uuid4()),
+        validation_alias=AliasChoices("id", "_id"),
+    )
     doctor_id: str
     reason: str
     approved: bool = False
-    created_at: str
-    dates: List[str]
+    created_at: UTCDateTime
+    dates: List[UTCDateTime]
+
+    def to_document(self) -> dict:
+        document = self.model_dump(mode="json", exclude={"id"})
+        document.update(self.model_dump(include={"created_at", "dates"}))
+        document["_id"] = self.id
+        return document
@@ -1,9 +1,21 @@
 from __future__ import annotations
 
+from datetime import datetime, timezone
 from enum import Enum
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import AfterValidator, BaseModel, Field
+from typing_extensions import Annotated
+
+
+def as_utc(value: datetime) -> datetime:
+    # Naive datetimes are treated as UTC, same as the "...Z" strings we used to store.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+UTCDateTime = Annotated[datetime, AfterValidator(as_utc)]
 
 
 class AppointmentStatus(str, Enum):
@@ -17,12 +29,19 @@ class Appointment(BaseModel):
     id: str = Field(..., alias="_id")
     patient_id: str
     doctor_id: str
-    start_date: str
-    end_date: str
+    start_date: UTCDateTime
+    end_date: UTCDateTime
     status: AppointmentStatus
     prescription: str = ""
     notes: str = ""
     reference: Optional[str] = None
-    created_at: str
+    created_at: UTCDateTime
     cancelled: bool = False
     paid: bool = False
+
+    def to_document(self) -> dict:
+        # JSON for everything else, native BSON dates for the datetime fields.
+        document = self.model_dump(mode="json")
+        document.update(self.model_dump(include={"start_date", "end_date", "created_at"}))
+        document["_id"] = document["id"]
+        return document
@@ -1,5 +1,6 @@
 from .appointment import *  # noqa
 from .email import *  # noqa
+from .hospital import *  # noqa
 from .login import *  # noqa
 from .patient import *  # noqa
 from .razorpay import *  # noqa
@@ -5,16 +5,44 @@ import uuid
 from datetime import datetime, timezone
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from pymongo.errors import BulkWriteError
 
 from src.app import app, database, razorpay_client
-from src.models import Access, Announcement, Appointment, Patient, Role, Staff
+from src.models import (
+    Access,
+    Announcement,
+    Appointment,
+    AppointmentStatus,
+    Role,
+    Staff,
+    as_utc,
+)
 from src.utils import Authentication
-from src.utils.email import send_smtp_email
+from src.utils.availability import availability_cache
+from src.utils.booking import (
+    INACTIVE_STATUSES,
+    SLOT_ALIGNMENT_ERROR,
+    as_datetime,
+    find_conflicting_appointment,
+    find_conflicting_appointments,
+    is_slot_aligned,
+    overlapping_ids,
+    release_slots,
+    reserve_slots,
+    reserve_slots_many,
+    with_legacy_dates,
+)
+from src.utils.outbox import enqueue_email
+from src.utils.pagination import encode_cursor, keyset_filter
+from src.utils.rollups import record_rollups
 
 router = APIRouter(tags=["Appointment"])
 
+MAX_BULK_APPOINTMENTS = 100
+
 
 async def log(admin_id: str, message: str):
     collection = database["hospitals"]
@@ -41,24 +69,23 @@ async def create_appointment(request: Request, appointment: Appointment):
     # appointment = Appointment(**appointment)
     appointment_collection = database["appointments"]
 
-    async for appointment_data in appointment_collection.find(
-        {"doctor_id": appointment.doctor_id}
-    ):
-        temp_appointment = Appointment(**appointment_data)
-
-        # Sample DateTime: 2025-04-02T06:30:00Z
-        # Convert to datetime objects
-        date_format = "%Y-%m-%dT%H:%M:%SZ"
-        temp_end_date = datetime.strptime(temp_appointment.end_date, date_format)
-        temp_start_date = datetime.strptime(temp_appointment.start_date, date_format)
-
-        start_date = datetime.strptime(appointment.start_date, date_format)
-        end_date = datetime.strptime(appointment.end_date, date_format)
-
-        if start_date < temp_end_date and end_date > temp_start_date:
-            raise HTTPException(
-                status_code=400, detail="Doctor is already booked for this time"
-            )
+    start_date = appointment.start_date
+    end_date = appointment.end_date
+    if start_date >= end_date:
+        raise HTTPException(status_code=400, detail="Invalid appointment dates")
+    if not (is_slot_aligned(start_date) and is_slot_aligned(end_date)):
+        raise HTTPException(status_code=400, detail=SLOT_ALIGNMENT_ERROR)
+
+    conflict = await find_conflicting_appointment(
+        appointment_collection,
+        appointment.doctor_id,
+        start_date,
+        end_date,
+    )
+    if conflict:
+        raise HTTPException(
+            status_code=400, detail="Doctor is already booked for this time"
+        )
 
     doctor = await database["users"].find_one({"_id": appointment.doctor_id})
     if not doctor:
@@ -68,21 +95,105 @@ async def create_appointment(request: Request, appointment: Appointment):
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    appointment_data = appointment.model_dump(mode="json")
-    appointment_data["_id"] = appointment_data["id"]
+    appointment_data = appointment.to_document()
     appointment_data["doctor_id"] = doctor["id"]
     appointment_data["patient_id"] = patient["id"]
 
-    await appointment_collection.insert_one(appointment_data)
-
-    staff = await database["users"].find_one({"_id": doctor["id"]})
-    hospital = await database["hospital"].find_one({"id": staff["hospital_id"]})
+    slots_collection = database["appointment_slots"]
+    reserved = await reserve_slots(
+        slots_collection, doctor["id"], start_date, end_date, appointment.id
+    )
+    if not reserved:
+        raise HTTPException(
+            status_code=400, detail="Doctor is already booked for this time"
+        )
 
-    # await log(hospital["admin_id"], f'{staff["first_name"]}')
+    try:
+        await appointment_collection.insert_one(appointment_data)
+    except Exception:
+        await release_slots(slots_collection, appointment.id)
+        raise
+    availability_cache.invalidate(doctor["id"])
+    await record_rollups([(doctor["id"], start_date, {"booked": 1})])
 
     return {"success": True}
 
 
+@router.post(
+    "/appointments/bulk",
+    dependencies=[Depends(Authentication.access_required(Access.CREATE_APPOINTMENT))],
+)
+async def create_appointments_bulk(appointments: List[Appointment]):
+    if len(appointments) > MAX_BULK_APPOINTMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_APPOINTMENTS} appointments per request",
+        )
+
+    appointment_collection = database["appointments"]
+    slots_collection = database["appointment_slots"]
+    errors: dict[str, str] = {}
+
+    seen = set()
+    for appointment in appointments:
+        if appointment.id in seen:
+            errors[appointment.id] = "Duplicate appointment id"
+        elif appointment.start_date >= appointment.end_date:
+            errors[appointment.id] = "Invalid appointment dates"
+        elif not (is_slot_aligned(appointment.start_date) and is_slot_aligned(appointment.end_date)):
+            errors[appointment.id] = SLOT_ALIGNMENT_ERROR
+        seen.add(appointment.id)
+
+    user_ids = {a.doctor_id for a in appointments} | {a.patient_id for a in appointments}
+    users = await database["users"].find(
+        {"_id": {"$in": list(user_ids)}}, {"id": 1}
+    ).to_list(None)
+    found = {user["_id"] for user in users}
+
+    for appointment in appointments:
+        if appointment.id in errors:
+            continue
+        if appointment.doctor_id not in found:
+            errors[appointment.id] = "Doctor not found"
+        elif appointment.patient_id not in found:
+            errors[appointment.id] = "Patient not found"
+
+    pending = [a for a in appointments if a.id not in errors]
+    existing = await find_conflicting_appointments(appointment_collection, pending)
+    errors.update(overlapping_ids(pending, existing))
+
+    pending = [a for a in pending if a.id not in errors]
+    for appointment_id in await reserve_slots_many(slots_collection, pending):
+        errors[appointment_id] = "Doctor is already booked for this time"
+
+    pending = [a for a in pending if a.id not in errors]
+    if pending:
+        try:
+            await appointment_collection.insert_many(
+                [appointment.to_document() for appointment in pending], ordered=False
+            )
+        except BulkWriteError as e:
+            failed = [pending[error["index"]].id for error in e.details["writeErrors"]]
+            for appointment_id in failed:
+                errors[appointment_id] = "Appointment could not be saved"
+                await release_slots(slots_collection, appointment_id)
+
+    for doctor_id in {a.doctor_id for a in pending}:
+        availability_cache.invalidate(doctor_id)
+    await record_rollups(
+        [(a.doctor_id, a.start_date, {"booked": 1}) for a in pending if a.id not in errors]
+    )
+
+    return [
+        {
+            "id": appointment.id,
+            "success": appointment.id not in errors,
+            "detail": errors.get(appointment.id),
+        }
+        for appointment in appointments
+    ]
+
+
 @router.get(
     "/appointment/{appointment_id}",
     dependencies=[Depends(Authentication.access_required(Access.READ_APPOINTMENT))],
@@ -99,11 +210,57 @@ async def get_appointment(appointment_id: str):
     dependencies=[Depends(Authentication.access_required(Access.UPDATE_APPOINTMENT))],
 )
 async def update_appointment(appointment_id: str, appointment: Appointment):
-    appointment_data = await database["appointments"].find_one({"_id": appointment_id})
-    if not appointment_data:
+    existing = await database["appointments"].find_one({"_id": appointment_id})
+    if not existing:
         raise HTTPException(status_code=404, detail="Appointment not found")
+
+    # Slot reservations follow the booking: released when it stops holding
+    # time, taken (or moved) when it holds time somewhere it did not before.
+    was_holding = not existing.get("cancelled") and existing.get("status") not in INACTIVE_STATUSES
+    will_hold = not appointment.cancelled and appointment.status.value not in INACTIVE_STATUSES
+    moved = (
+        existing["doctor_id"] != appointment.doctor_id
+        or as_datetime(existing["start_date"]) != appointment.start_date
+        or as_datetime(existing["end_date"]) != appointment.end_date
+    )
+    slots_collection = database["appointment_slots"]
+    if not will_hold:
+        await release_slots(slots_collection, appointment_id)
+    elif not was_holding or moved:
+        start_date, end_date = appointment.start_date, appointment.end_date
+        if start_date >= end_date:
+            raise HTTPException(status_code=400, detail="Invalid appointment dates")
+        if not (is_slot_aligned(start_date) and is_slot_aligned(end_date)):
+            raise HTTPException(status_code=400, detail=SLOT_ALIGNMENT_ERROR)
+
+        conflict = await find_conflicting_appointment(
+            database["appointments"], appointment.doctor_id, start_date, end_date, appointment_id
+        )
+        if conflict:
+            raise HTTPException(status_code=400, detail="Doctor is already booked for this time")
+
+        await release_slots(slots_collection, appointment_id)
+        if not await reserve_slots(
+            slots_collection, appointment.doctor_id, start_date, end_date, appointment_id
+        ):
+            if was_holding:
+                # Put the old reservation back; it was ours a moment ago.
+                await reserve_slots(
+                    slots_collection,
+                    existing["doctor_id"],
+                    as_datetime(existing["start_date"]),
+                    as_datetime(existing["end_date"]),
+                    appointment_id,
+                )
+            raise HTTPException(status_code=400, detail="Doctor is already booked for this time")
+    if was_holding != will_hold or moved:
+        availability_cache.invalidate(existing["doctor_id"])
+        availability_cache.invalidate(appointment.doctor_id)
+
+    appointment_data = appointment.to_document()
+    appointment_data.pop("_id")
     await database["appointments"].update_one(
-        {"_id": appointment_id}, {"$set": appointment.model_dump(mode="json")}
+        {"_id": appointment_id}, {"$set": appointment_data}
     )
     return {"success": True}
 
@@ -112,23 +269,59 @@ async def update_appointment(appointment_id: str, appointment: Appointment):
     "/appointments/{doctor_id_or_patient_id}",
     dependencies=[Depends(Authentication.access_required(Access.READ_APPOINTMENT))],
 )
-async def get_appointments(doctor_id_or_patient_id: str, completed: bool = False):
-    appointments = (
-        await database["appointments"]
-        .find(
-            {
-                "$or": [
-                    {"doctor_id": doctor_id_or_patient_id},
-                    {"patient_id": doctor_id_or_patient_id},
-                ]
-            }
-        )
-        .to_list(length=100)
+async def get_appointments(
+    response: Response,
+    doctor_id_or_patient_id: str,
+    completed: Optional[bool] = None,
+    status: Optional[AppointmentStatus] = None,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    stream: bool = False,
+):
+    # Each $or branch is served by its own (owner, start_date, _id) index.
+    filters: list[dict] = [
+        {
+            "$or": [
+                {"doctor_id": doctor_id_or_patient_id},
+                {"patient_id": doctor_id_or_patient_id},
+            ]
+        }
+    ]
+    if completed is not None:
+        filters.append({"status": "Completed"} if completed else {"status": {"$ne": "Completed"}})
+    if status is not None:
+        filters.append({"status": status.value})
+    if from_date is not None:
+        filters.append(with_legacy_dates({"start_date": {"$gte": as_utc(from_date)}}))
+    if to_date is not None:
+        filters.append(with_legacy_dates({"start_date": {"$lt": as_utc(to_date)}}))
+    if cursor is not None:
+        filters.append(keyset_filter("start_date", cursor))
+
+    query = database["appointments"].find({"$and": filters}).sort(
+        [("start_date", 1), ("_id", 1)]
     )
 
-    if not appointments:
+    if stream:
+
+        async def rows():
+            async for appointment in query:
+                yield Appointment.model_validate(appointment).model_dump_json(by_alias=True) + "\n"
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    appointments = await query.limit(limit + 1).to_list(length=limit + 1)
+
+    if not appointments and cursor is None:
         raise HTTPException(status_code=404, detail="No appointments found")
 
+    if len(appointments) > limit:
+        appointments = appointments[:limit]
+        last = appointments[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["start_date"], last["_id"])
+
     return [Appointment.model_validate(appointment) for appointment in appointments]
 
 
@@ -142,21 +335,33 @@ async def cancel_appointment(appointment_id: str):
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
 
-    await database["appointments"].update_one(
-        {"_id": appointment_id}, {"$set": {"cancelled": True, "doctor_id": "", "patient_id": ""}}
+    result = await database["appointments"].update_one(
+        {"_id": appointment_id, "cancelled": {"$ne": True}},
+        {
+            "$set": {
+                "cancelled": True,
+                "doctor_id": "",
+                "patient_id": "",
+                "cancelled_doctor_id": appointment["doctor_id"],
+            }
+        },
     )
+    await release_slots(database["appointment_slots"], appointment_id)
+    availability_cache.invalidate(appointment["doctor_id"])
+    if result.modified_count:
+        await record_rollups(
+            [(appointment["doctor_id"], appointment["start_date"], {"cancelled": 1})]
+        )
 
     # razorpay_client.payment.refund("pay_" + appointment["razorpay_payment_id"].split("_")[1])
 
     patient_data = await database["users"].find_one({"_id": appointment["patient_id"]})
 
-    patient = Patient(**patient_data)
-
-    if patient:
-        await send_smtp_email(
-            to_email=patient.email_address,
+    if patient_data:
+        await enqueue_email(
+            to_email=patient_data["email_address"],
             subject="Appointment Cancelled",
-            body=f"Your appointment with has been cancelled. Refund initiated.",
+            body="Your appointment with has been cancelled. Refund initiated.",
         )
 
     return True
@@ -167,8 +372,9 @@ async def cancel_appointment(appointment_id: str):
     dependencies=[Depends(Authentication.access_required(Access.UPDATE_APPOINTMENT))],
 )
 async def mark_appointment_as_done(appointment_id: str):
-    await database["appointments"].update_one(
-        {"_id": appointment_id}, {"$set": {"status": "Completed"}}
+    result = await database["appointments"].update_one(
+        {"_id": appointment_id, "status": {"$ne": "Completed"}},
+        {"$set": {"status": "Completed"}},
     )
 
     collection = database["users"]
@@ -185,24 +391,30 @@ async def mark_appointment_as_done(appointment_id: str):
     )
     announcement_data = announcement.model_dump(mode="json")
     appointment = await database["appointments"].find_one({"_id": appointment_id})
+    if appointment is None:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+
+    if result.modified_count:
+        # A completed booking no longer holds the doctor's time.
+        await release_slots(database["appointment_slots"], appointment_id)
+        availability_cache.invalidate(appointment["doctor_id"])
+        await record_rollups(
+            [(appointment["doctor_id"], appointment["start_date"], {"completed": 1})]
+        )
 
     await collection.update_one(
         {"_id": appointment["patient_id"]},
         {"$addToSet": {"announcements": announcement_data}},
     )
 
-    try:
-        patient_data = await database["users"].find_one({"_id": appointment["patient_id"]})
-        patient = Patient(**patient_data)
-
-        if patient:
-            await send_smtp_email(
-                to_email=patient.email_address,
-                subject="Appointment Cancelled",
-                body=f"Your appointment with has been cancelled. Refund initiated.",
-            )
-    except Exception:
-        pass
+    patient_data = await database["users"].find_one({"_id": appointment["patient_id"]})
+
+    if patient_data:
+        await enqueue_email(
+            to_email=patient_data["email_address"],
+            subject="Appointment Completed",
+            body="Your appointment is completed, and marked as done.",
+        )
 
     return {"success": True}
 
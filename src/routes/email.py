@@ -2,16 +2,17 @@ from __future__ import annotations
 
 import asyncio
 import os
-import random
 import smtplib
-import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from fastapi import APIRouter, Depends, HTTPException
 
 from src.app import app
-from src.utils.email import send_smtp_email
+from src.utils.email import send_smtp_email, smtp_pool
+from src.utils.otp import otp_store
+from src.utils.outbox import outbox_worker
+from src.utils.ratelimit import RateLimiter, enforce, limit_by_ip
 
 EMAIL = os.environ["EMAIL"]
 PASSWORD = os.environ["PASSWORD"]
@@ -21,8 +22,19 @@ with open("src/utils/email-body-otp-requested.txt", "r") as f:
 
 router = APIRouter(tags=["Email"])
 
-otp_store = {}
-OTP_EXPIRY_TIME = 300
+otp_ip_limiter = RateLimiter("otp-ip", capacity=10, period=600)
+otp_account_limiter = RateLimiter("otp-account", capacity=3, period=600)
+
+
+@app.on_event("startup")
+async def start_outbox_worker():
+    outbox_worker.start()
+
+
+@app.on_event("shutdown")
+async def close_smtp_pool():
+    await outbox_worker.stop()
+    await smtp_pool.close()
 
 
 @app.get("/email/send")
@@ -33,10 +45,13 @@ async def send_email(to_email: str, subject: str, body: str):
         raise HTTPException(status_code=500, detail="Email sending failed")
 
 
-@app.get("/request-otp")
+@app.get("/request-otp", dependencies=[Depends(limit_by_ip(otp_ip_limiter))])
 async def request_otp(to_email: str):
-    otp = random.randint(100000, 999999)
-    otp_store[to_email] = (otp, time.time())
+    await enforce(otp_account_limiter, to_email.lower())
+    otp = await otp_store.issue(to_email)
+    if otp is None:
+        raise HTTPException(status_code=429, detail="OTP already sent, please wait before retrying")
+
     email_body = EMAIL_BODY_PASSWORD_RESET.format(to_email, otp)
 
     if await send_smtp_email(to_email, "Your OTP Code", email_body):
@@ -47,16 +62,11 @@ async def request_otp(to_email: str):
 
 @app.get("/verify-otp")
 async def verify_otp(to_email: str, otp: int):
-    if to_email not in otp_store:
+    verified = await otp_store.verify(to_email, otp)
+    if verified is None:
         raise HTTPException(status_code=400, detail="OTP not found or expired")
 
-    stored_otp, timestamp = otp_store[to_email]
-    if time.time() - timestamp > OTP_EXPIRY_TIME:
-        del otp_store[to_email]
-        raise HTTPException(status_code=400, detail="OTP expired")
-
-    if stored_otp == otp:
-        del otp_store[to_email]
+    if verified:
         return {"success": True}
     else:
         raise HTTPException(status_code=400, detail="Invalid OTP")
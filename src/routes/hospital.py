@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from src.app import app, database
+from src.models import Access, as_utc
+from src.utils import Authentication
+from src.utils.analytics import analytics_cache, compute_analytics
+from src.utils.rollups import COUNTERS, rollup_day
+
+router = APIRouter(tags=["Hospital"])
+
+
+async def get_hospital_id(admin_id: str) -> str:
+    hospital = await database["hospitals"].find_one({"admin_id": admin_id}, {"id": 1})
+    if hospital is None:
+        raise HTTPException(status_code=404, detail="Hospital not found")
+    return hospital["id"]
+
+
+@router.get(
+    "/hospital/{admin_id}/revenue",
+    dependencies=[Depends(Authentication.access_required(Access.READ_HOSPITAL))],
+)
+async def hospital_revenue(
+    admin_id: str,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+):
+    hospital_id = await get_hospital_id(admin_id)
+
+    match: dict = {"hospital_id": hospital_id}
+    if from_date is not None or to_date is not None:
+        match["day"] = {}
+        if from_date is not None:
+            match["day"]["$gte"] = as_utc(from_date)
+        if to_date is not None:
+            match["day"]["$lt"] = as_utc(to_date)
+
+    # Reads the rollups only: one row per doctor and day, never raw appointments.
+    days = await database["rollups"].aggregate(
+        [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": "$day",
+                    "booked": {"$sum": "$booked"},
+                    "cancelled": {"$sum": "$cancelled"},
+                    "completed": {"$sum": "$completed"},
+                    "paid_amount": {"$sum": "$paid_amount"},
+                }
+            },
+            {"$sort": {"_id": 1}},
+            {"$project": {"_id": 0, "day": "$_id", "booked": 1, "cancelled": 1, "completed": 1, "paid_amount": 1}},
+        ]
+    ).to_list(None)
+
+    return {
+        "hospital_id": hospital_id,
+        "days": days,
+        "total": {
+            counter: sum(day[counter] for day in days)
+            for counter in COUNTERS
+        },
+    }
+
+
+@router.get(
+    "/hospital/{admin_id}/analytics",
+    dependencies=[Depends(Authentication.access_required(Access.READ_HOSPITAL))],
+)
+async def hospital_analytics(
+    admin_id: str,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    refresh: bool = False,
+):
+    hospital_id = await get_hospital_id(admin_id)
+
+    # Day-aligned bounds keep the cache key stable across requests.
+    end = rollup_day(as_utc(to_date)) if to_date else rollup_day(datetime.now(timezone.utc)) + timedelta(days=1)
+    start = rollup_day(as_utc(from_date)) if from_date else end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+
+    return await analytics_cache.get(
+        (hospital_id, start, end),
+        lambda: compute_analytics(hospital_id, start, end),
+        refresh=refresh,
+    )
+
+
+app.include_router(router)
@@ -16,7 +16,14 @@ from src.models import (
     Patient,
     Staff,
 )
-from src.utils import Authentication
+from src.utils import Authentication, Principal
+from src.utils.passwords import (
+    hash_password,
+    is_hashed,
+    shutdown_password_pool,
+    verify_password,
+)
+from src.utils.ratelimit import RateLimiter, enforce, limit_by_ip
 
 SECRET_KEY = os.environ["SECRET_KEY"]
 ALGORITHM = "HS256"
@@ -57,51 +64,80 @@ class HardPasswordChange(BaseModel):
 
 router = APIRouter(tags=["Login"])
 
+login_ip_limiter = RateLimiter("login-ip", capacity=20, period=60)
+login_account_limiter = RateLimiter("login-account", capacity=5, period=60)
+
 
 async def authenticate_user(email_address: str, password: str, role: str | None = None):
-    query = {"email_address": email_address, "password": password}
+    await enforce(login_account_limiter, f"{role}:{email_address.lower()}")
+
+    query = {"email_address": email_address}
     if role:
         query["role"] = role
 
+    # Served by the unique (email_address, role) index; bcrypt runs off-loop.
     user = await database["users"].find_one(query)
-    if user is None:
+    if user is None or not await verify_password(password, user.get("password", "")):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    if not is_hashed(user["password"]):
+        await database["users"].update_one(
+            {"_id": user["_id"], "password": user["password"]},
+            {"$set": {"password": await hash_password(password)}},
+        )
+
+    # Resolved once here so admin routes can read it from the token.
+    hospital_id = user.get("hospital_id", "")
+    if user["role"] == "admin":
+        hospital = await database["hospitals"].find_one({"admin_id": user["_id"]}, {"id": 1})
+        hospital_id = hospital["id"] if hospital else ""
+
     return Token(
-        access_token=Authentication.encode(user, *ACCESS_MAP[user["role"]]),
+        access_token=Authentication.encode(
+            user, *ACCESS_MAP[user["role"]], hospital_id=hospital_id
+        ),
         token_type="bearer",
         user=ACCESS_MAP_CLASS[user["role"]].model_validate(user),
     )
 
 
-@router.post("/admin/login", response_model=Token)
+@router.post(
+    "/admin/login",
+    response_model=Token,
+    dependencies=[Depends(limit_by_ip(login_ip_limiter))],
+)
 async def admin_login(user: UserLogin):
     return await authenticate_user(user.email_address, user.password, "admin")
 
 
-@router.post("/doctor/login", response_model=Token)
+@router.post(
+    "/doctor/login",
+    response_model=Token,
+    dependencies=[Depends(limit_by_ip(login_ip_limiter))],
+)
 async def doctor_login(user: UserLogin):
     return await authenticate_user(user.email_address, user.password, "doctor")
 
 
-@router.post("/patient/login", response_model=Token)
+@router.post(
+    "/patient/login",
+    response_model=Token,
+    dependencies=[Depends(limit_by_ip(login_ip_limiter))],
+)
 async def patient_login(user: UserLogin):
     return await authenticate_user(user.email_address, user.password, "patient")
 
 
-async def update_password(request: Request, password_change: PasswordChange, role: str):
+async def update_password(principal: Principal, password_change: PasswordChange, role: str):
     collection = database["users"]
-    token = request.headers.get("Authorization").split(" ")[1]
-    current_user = Authentication.get_current_user(token)
 
-    user = await collection.find_one({"email_address": current_user["sub"], "role": role})
-    print(user)
+    user = await collection.find_one({"email_address": principal.email_address, "role": role})
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     await collection.update_one(
-        {"email_address": current_user["sub"], "role": role},
-        {"$set": {"password": password_change.new_password}},
+        {"email_address": principal.email_address, "role": role},
+        {"$set": {"password": await hash_password(password_change.new_password)}},
     )
     return {"success": True}
 
@@ -115,7 +151,7 @@ async def change_password(request: Request, password_change: HardPasswordChange)
 
     await collection.update_one(
         {"email_address": password_change.email_address},
-        {"$set": {"password": password_change.new_password}},
+        {"$set": {"password": await hash_password(password_change.new_password)}},
     )
     return {"success": True}
 
@@ -123,22 +159,36 @@ async def change_password(request: Request, password_change: HardPasswordChange)
 @router.patch(
     "/patient/change-password",
 )
-async def change_patient_password(request: Request, password_change: PasswordChange):
-    return await update_password(request, password_change, role="patient")
+async def change_patient_password(
+    password_change: PasswordChange,
+    principal: Principal = Depends(Authentication.get_principal),
+):
+    return await update_password(principal, password_change, role="patient")
 
 
 @router.patch(
     "/admin/change-password",
 )
-async def change_admin_password(request: Request, password_change: PasswordChange):
-    return await update_password(request, password_change, role="admin")
+async def change_admin_password(
+    password_change: PasswordChange,
+    principal: Principal = Depends(Authentication.get_principal),
+):
+    return await update_password(principal, password_change, role="admin")
 
 
 @router.patch(
     "/doctor/change-password",
 )
-async def change_doctor_password(request: Request, password_change: PasswordChange):
-    return await update_password(request, password_change, role="doctor")
+async def change_doctor_password(
+    password_change: PasswordChange,
+    principal: Principal = Depends(Authentication.get_principal),
+):
+    return await update_password(principal, password_change, role="doctor")
+
+
+@app.on_event("shutdown")
+async def close_password_pool():
+    shutdown_password_pool()
 
 
 app.include_router(router)
@@ -8,6 +8,8 @@ from pydantic import BaseModel
 from src.app import app, database
 from src.models import Access, Announcement, Patient, Review
 from src.utils import Authentication
+from src.utils.passwords import hash_password
+from src.utils.search_index import doctor_index
 
 
 class ClientRequest(BaseModel):
@@ -31,6 +33,9 @@ async def create_patient(request: Request, patient: Patient):
     if user is not None:
         raise HTTPException(status_code=400, detail="User already exists")
 
+    # Hashed only once the account is known to be new; bcrypt is the costly part.
+    sendable["password"] = await hash_password(patient.password)
+
     await collection.insert_one(sendable)
     return {"success": True}
 
@@ -50,15 +55,17 @@ async def get_patient(patient_id: str) -> Patient:
 @router.put(
     "/patient/{patient_id}",
     dependencies=[
-        Depends(Authentication.access_required(Access.UPDATE_PATIENT)),
-        Depends(Authentication.access_required(Access.READ_PATIENT)),
+        Depends(Authentication.access_required(Access.UPDATE_PATIENT, Access.READ_PATIENT)),
     ],
 )
 async def update_patient(
     patient_id: str, request: Request, client_request: ClientRequest
 ):
     collection = database["users"]
-    await collection.update_one({"_id": patient_id}, {"$set": client_request.data})
+    data = client_request.data
+    if "password" in data:
+        data["password"] = await hash_password(data["password"])
+    await collection.update_one({"_id": patient_id}, {"$set": data})
     return {"success": True}
 
 
@@ -178,6 +185,7 @@ async def create_review(doctor_id: str, review: Review):
     sendable["_id"] = sendable["id"]
 
     await collection.insert_one(sendable)
+    doctor_index.add_review(review.doctor_id, review.stars)
 
     return {"success": True}
 
@@ -185,8 +193,7 @@ async def create_review(doctor_id: str, review: Review):
 @router.get(
     "/reviews/{doctor_id_or_patient_id}",
     dependencies=[
-        Depends(Authentication.access_required(Access.READ_STAFF)),
-        Depends(Authentication.access_required(Access.READ_PATIENT)),
+        Depends(Authentication.access_required(Access.READ_STAFF, Access.READ_PATIENT)),
     ],
 )
 async def fetch_reviews(doctor_id_or_patient_id: str):
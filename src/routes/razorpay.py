@@ -1,19 +1,36 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from razorpay.errors import SignatureVerificationError
 
-from src.app import app, database, razorpay_client
-from src.models import Appointment, Patient, Staff
+from src.app import app, database
+from src.models import Appointment, Patient, Staff, as_utc
+from src.utils.availability import availability_cache
+from src.utils.booking import (
+    SLOT_ALIGNMENT_ERROR,
+    find_conflicting_appointment,
+    is_slot_aligned,
+    release_slots,
+    reserve_slots,
+    with_legacy_dates,
+)
+from src.utils.payments import get_payment_links, razorpay_gateway
+from src.utils.pending_orders import pending_orders
+from src.utils.rollups import record_rollups
 
 router = APIRouter(tags=["Razorpay"], prefix="/razorpay-gateway")
 from fastapi.responses import JSONResponse
 
-cache: dict[str, Appointment] = {}
-
-
 @router.post("/create-order-appointment")
 async def rpay_order_appointment(appointment: Appointment):
+    # Checked before taking payment; verify_payment reserves these exact buckets.
+    if appointment.start_date >= appointment.end_date:
+        raise HTTPException(status_code=400, detail="Invalid appointment dates")
+    if not (is_slot_aligned(appointment.start_date) and is_slot_aligned(appointment.end_date)):
+        raise HTTPException(status_code=400, detail=SLOT_ALIGNMENT_ERROR)
 
     doctor_id = appointment.doctor_id
     doctor_data = await database["users"].find_one({"role": "doctor", "id": doctor_id})
@@ -21,7 +38,7 @@ async def rpay_order_appointment(appointment: Appointment):
     fees = staff.consultation_fee
 
     appointment_data = appointment.model_dump(mode="json")
-    order_data = razorpay_client.payment_link.create(
+    order_data = await razorpay_gateway.create_payment_link(
         {
             "amount": max(fees * 100, 100),
             "currency": "INR",
@@ -31,8 +48,8 @@ async def rpay_order_appointment(appointment: Appointment):
             "notes": {
                 "doctor_id": appointment.doctor_id,
                 "patient_id": appointment.patient_id,
-                "start_date": appointment.start_date,
-                "end_date": appointment.end_date,
+                "start_date": appointment_data["start_date"],
+                "end_date": appointment_data["end_date"],
             },
             "callback_url": "http://13.233.139.216:8080/razorpay-gateway/verify-payment",
         }
@@ -41,7 +58,7 @@ async def rpay_order_appointment(appointment: Appointment):
     await database["appointments"].update_one(
         {"id": appointment.id}, {"$set": {"razorpay_order_data": order_data}}
     )
-    cache[order_data["id"]] = appointment
+    await pending_orders.put(order_data["id"], appointment)
     return order_data
 
 
@@ -52,38 +69,219 @@ async def verify_payment(
     razorpay_payment_link_status: str,
     razorpay_signature: str,
 ):
-    sendable = cache[razorpay_payment_link_id].model_dump(mode="json")
-    sendable["_id"] = sendable["id"]
-    sendable["razorpay_payment_id"] = razorpay_payment_link_id
-    await database["appointments"].insert_one(sendable)
+    # Left in the store until it expires, so gateway retries stay idempotent.
+    appointment = await pending_orders.get(razorpay_payment_link_id)
+    if appointment is None:
+        raise HTTPException(status_code=404, detail="Order not found or expired")
 
-    return f"Payment {razorpay_payment_link_status == 'paid'}. You may now close this window."
+    sendable = appointment.to_document()
+    sendable["razorpay_payment_id"] = razorpay_payment_link_id
 
+    paid_message = f"Payment {razorpay_payment_link_status == 'paid'}. You may now close this window."
+    taken_message = "This slot was booked by someone else. Your refund will be initiated."
+    if await database["appointments"].find_one({"_id": appointment.id}, {"_id": 1}):
+        # Gateway retried the callback for an already booked appointment.
+        return paid_message
 
-@router.get("/bills/{admin_id}")
-async def bills(admin_id: str):
-    hospital_data = await database["hospitals"].find_one({"admin_id": admin_id})
-    doctor_ids = []
+    # Bookings made before slot reservations existed hold no slot rows, so the
+    # interval check still runs before the reservation.
+    if await find_conflicting_appointment(
+        database["appointments"],
+        appointment.doctor_id,
+        appointment.start_date,
+        appointment.end_date,
+        appointment.id,
+    ):
+        return taken_message
 
-    staffs = (
-        await database["users"].find({"hospital_id": hospital_data["id"]}).to_list(100)
+    slots_collection = database["appointment_slots"]
+    reserved = await reserve_slots(
+        slots_collection,
+        appointment.doctor_id,
+        appointment.start_date,
+        appointment.end_date,
+        appointment.id,
     )
-    doctor_ids = [staff["id"] for staff in staffs]
-    appointments = (
-        await database["appointments"]
-        .find(
-            {"doctor_id": {"$in": doctor_ids}, "razorpay_payment_id": {"$exists": True}}
-        )
-        .to_list(100)
+    if not reserved:
+        if await database["appointments"].find_one({"_id": appointment.id}, {"_id": 1}):
+            # A concurrent retry of the same callback got there first.
+            return paid_message
+        return taken_message
+
+    try:
+        await database["appointments"].insert_one(sendable)
+    except Exception:
+        await release_slots(slots_collection, appointment.id)
+        raise
+    availability_cache.invalidate(appointment.doctor_id)
+
+    # Warm the payment-link cache so bill listings never fetch this link again.
+    payload, = await get_payment_links([razorpay_payment_link_id])
+    paid_amount = (payload or {}).get("amount_paid", 0)
+    await record_rollups(
+        [(appointment.doctor_id, appointment.start_date, {"booked": 1, "paid_amount": paid_amount})]
     )
-    razorpay_payloads = []
 
-    for appointmet in appointments:
-        razorpay_payloads.append(
-            razorpay_client.payment_link.fetch(appointmet["razorpay_payment_id"])
-        )
+    return paid_message
+
+
+def billing_pipeline(
+    admin_id: str,
+    from_date: datetime | None,
+    to_date: datetime | None,
+    offset: int,
+    limit: int,
+) -> list[dict]:
+    date_range = {}
+    if from_date is not None:
+        date_range["$gte"] = as_utc(from_date)
+    if to_date is not None:
+        date_range["$lt"] = as_utc(to_date)
+
+    appointment_match: dict = {"razorpay_payment_id": {"$exists": True}}
+    if date_range:
+        appointment_match.update(with_legacy_dates({"start_date": date_range}))
+
+    return [
+        {"$match": {"admin_id": admin_id}},
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "id",
+                "foreignField": "hospital_id",
+                "pipeline": [
+                    {"$project": {"id": 1, "first_name": 1, "last_name": 1, "consultation_fee": 1}}
+                ],
+                "as": "doctor",
+            }
+        },
+        {"$unwind": "$doctor"},
+        {
+            "$lookup": {
+                "from": "appointments",
+                "localField": "doctor.id",
+                "foreignField": "doctor_id",
+                "pipeline": [
+                    {"$match": appointment_match},
+                    {"$project": {"start_date": 1, "patient_id": 1, "razorpay_payment_id": 1}},
+                ],
+                "as": "appointment",
+            }
+        },
+        {"$unwind": "$appointment"},
+        {
+            "$lookup": {
+                "from": "payment_links",
+                "localField": "appointment.razorpay_payment_id",
+                "foreignField": "_id",
+                "as": "payment_link",
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "appointment_id": "$appointment._id",
+                "doctor_id": "$doctor.id",
+                "doctor_name": {
+                    "$trim": {
+                        "input": {
+                            "$concat": [
+                                {"$ifNull": ["$doctor.first_name", ""]},
+                                " ",
+                                {"$ifNull": ["$doctor.last_name", ""]},
+                            ]
+                        }
+                    }
+                },
+                "patient_id": "$appointment.patient_id",
+                "start_date": "$appointment.start_date",
+                "razorpay_payment_id": "$appointment.razorpay_payment_id",
+                # Paise, like Razorpay; the fee stands in until the link is cached.
+                "amount": {
+                    "$ifNull": [
+                        {"$first": "$payment_link.payload.amount_paid"},
+                        {"$multiply": [{"$ifNull": ["$doctor.consultation_fee", 0]}, 100]},
+                    ]
+                },
+            }
+        },
+        {
+            "$facet": {
+                "bills": [
+                    {"$sort": {"start_date": -1, "appointment_id": 1}},
+                    {"$skip": offset},
+                    {"$limit": limit},
+                ],
+                "subtotals": [
+                    {
+                        "$group": {
+                            "_id": "$doctor_id",
+                            "doctor_name": {"$first": "$doctor_name"},
+                            "appointments": {"$sum": 1},
+                            "amount": {"$sum": "$amount"},
+                        }
+                    },
+                    {"$sort": {"amount": -1}},
+                    {"$project": {"_id": 0, "doctor_id": "$_id", "doctor_name": 1, "appointments": 1, "amount": 1}},
+                ],
+                "total": [
+                    {"$group": {"_id": None, "appointments": {"$sum": 1}, "amount": {"$sum": "$amount"}}},
+                    {"$project": {"_id": 0}},
+                ],
+            }
+        },
+    ]
+
+
+async def billing_report(
+    admin_id: str,
+    from_date: datetime | None,
+    to_date: datetime | None,
+    offset: int,
+    limit: int,
+) -> dict:
+    results = await database["hospitals"].aggregate(
+        billing_pipeline(admin_id, from_date, to_date, offset, limit)
+    ).to_list(None)
+    report = results[0] if results else {"bills": [], "subtotals": [], "total": []}
+
+    # Payloads for this page only; cached links cost nothing, stale ones one fetch each.
+    bills = report["bills"]
+    payloads = await get_payment_links([bill["razorpay_payment_id"] for bill in bills])
+    for bill, payload in zip(bills, payloads):
+        bill["payment_link"] = payload
+
+    return {
+        "bills": bills,
+        "subtotals": report["subtotals"],
+        "total": report["total"][0] if report["total"] else {"appointments": 0, "amount": 0},
+        "offset": offset,
+        "limit": limit,
+    }
+
+
+@router.get("/bills/{admin_id}")
+async def bills(
+    admin_id: str,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+):
+    report = await billing_report(admin_id, from_date, to_date, offset, limit)
+    return [bill["payment_link"] for bill in report["bills"] if bill["payment_link"] is not None]
+
+
+@router.get("/bills/{admin_id}/report")
+async def bills_report(
+    admin_id: str,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+):
+    return await billing_report(admin_id, from_date, to_date, offset, limit)
 
-    return razorpay_payloads
 
 @router.get(
     "/bills/patient/{patient_id}",
@@ -93,14 +291,14 @@ async def patient_bills(patient_id: str):
         {"patient_id": patient_id, "razorpay_payment_id": {"$exists": True}}
     ).to_list(100)
 
-    razorpay_payloads = []
+    payment_link_ids = [appointment["razorpay_payment_id"] for appointment in appointments]
+    payloads = await get_payment_links(payment_link_ids)
+    return [payload for payload in payloads if payload is not None]
 
-    for appointmet in appointments:
-        razorpay_payloads.append(
-            razorpay_client.payment_link.fetch(appointmet["razorpay_payment_id"])
-        )
 
-    return razorpay_payloads
+@app.on_event("shutdown")
+async def close_razorpay_gateway():
+    await razorpay_gateway.close()
 
 
 app.include_router(router)
@@ -1,77 +1,181 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 
 from src.app import app, database
-from src.models import Access, Staff
-from src.utils import Authentication, get_doctor_id
+from src.models import Access, Hospital, Staff
+from src.utils import Authentication
+from src.utils.geo import MAX_RADIUS_KM, hospital_distances, near_stage
+from src.utils.ratelimit import RateLimiter, limit_by_ip
+from src.utils.search_index import NAME_FIELDS, doctor_index
+from src.utils.symptom_search import (
+    SymptomMatchUnavailable,
+    match_doctor,
+    shutdown_symptom_pool,
+)
 
 router = APIRouter(tags=["Search"])
 
+symptoms_limiter = RateLimiter("symptoms-ip", capacity=10, period=60)
+
+
+@app.on_event("startup")
+async def start_doctor_index():
+    doctor_index.start()
+
+
+@app.on_event("shutdown")
+async def stop_doctor_index():
+    await doctor_index.stop()
+
+
+def search_doctors(query: str, fields: tuple[str, ...], limit: int) -> list[Staff]:
+    return [Staff(**document) for _, document in doctor_index.search(query, fields, limit)]
+
 
 @router.get(
-    "/search/doctors/name",
+    "/search/doctors",
     dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
 )
-async def search_doctor_by_name(query: str):
-    collection = database["users"]
-    staffs_data = await collection.find(
-        {"role": "doctor", "active": True, "name": {"$regex": query, "$options": "i"}}
-    ).to_list(length=100)
+async def search_doctors_faceted(
+    query: str = "",
+    hospital_id: Optional[str] = None,
+    specialization: Optional[str] = None,
+    department: Optional[str] = None,
+    min_rating: Optional[float] = Query(None, ge=0, le=5),
+    min_fee: Optional[int] = Query(None, ge=0),
+    max_fee: Optional[int] = Query(None, ge=0),
+    on_leave: Optional[bool] = None,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius: float = Query(10, gt=0, le=MAX_RADIUS_KM),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    if (lat is None) != (lon is None):
+        raise HTTPException(400, detail="lat and lon must be given together")
+
+    distances = None if lat is None else await hospital_distances(lat, lon, radius)
+
+    results, facets = doctor_index.query(
+        query,
+        hospital_id=hospital_id,
+        hospital_ids=None if distances is None else set(distances),
+        specialization=specialization,
+        department=department,
+        min_rating=min_rating,
+        min_fee=min_fee,
+        max_fee=max_fee,
+        on_leave=on_leave,
+    )
+    if distances is not None:
+        # Stable, so doctors at the same hospital keep their relevance order.
+        results.sort(key=lambda result: distances[result[1]["hospital_id"]])
+
+    return {
+        "total": len(results),
+        "offset": offset,
+        "limit": limit,
+        "results": [
+            {
+                "doctor": Staff(**document),
+                "score": score,
+                "rating": doctor_index.rating(str(document["_id"])),
+                "distance_km": None if distances is None else distances[document["hospital_id"]],
+            }
+            for score, document in results[offset : offset + limit]
+        ],
+        "facets": facets,
+    }
 
-    return [Staff(**data) for data in staffs_data]
+
+@router.get(
+    "/search/hospitals/nearby",
+    dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
+)
+async def search_hospitals_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(10, gt=0, le=MAX_RADIUS_KM),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    # Only hospitals with a bookable doctor; $geoNear already sorts by distance.
+    available = doctor_index.available_hospitals()
+    page = await database["hospitals"].aggregate(
+        [
+            near_stage(lat, lon, radius, {"_id": {"$in": list(available)}}),
+            {
+                "$facet": {
+                    "total": [{"$count": "count"}],
+                    "results": [{"$skip": offset}, {"$limit": limit}],
+                }
+            },
+        ]
+    ).to_list(None)
+    total = page[0]["total"][0]["count"] if page and page[0]["total"] else 0
+
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": [
+            {
+                "hospital": Hospital.model_validate(hospital),
+                "distance_km": hospital["distance"] / 1000,
+                "available_doctors": available[hospital["_id"]],
+            }
+            for hospital in (page[0]["results"] if page else [])
+        ],
+    }
+
+
+@router.get(
+    "/search/doctors/name",
+    dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
+)
+async def search_doctor_by_name(query: str, limit: int = Query(100, ge=1, le=500)):
+    return search_doctors(query, NAME_FIELDS, limit)
 
 
 @router.get(
     "/search/doctors/specialization",
     dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
 )
-async def search_doctor_by_specialization(query: str):
-    collection = database["users"]
-    staffs_data = await collection.find(
-        {
-            "role": "doctor",
-            "active": True,
-            "specialization": {"$regex": query, "$options": "i"},
-        }
-    ).to_list(length=100)
-
-    return [Staff(**data) for data in staffs_data]
+async def search_doctor_by_specialization(query: str, limit: int = Query(100, ge=1, le=500)):
+    return search_doctors(query, ("specialization",), limit)
+
 
 @router.get(
     "/search/doctors/department",
     dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
 )
-async def search_doctor_by_department(query: str):
-    collection = database["users"]
-    staffs_data = await collection.find(
-        {
-            "role": "doctor",
-            "active": True,
-            "department": {"$regex": query, "$options": "i"},
-        }
-    ).to_list(length=100)
-
-    return [Staff(**data) for data in staffs_data]
+async def search_doctor_by_department(query: str, limit: int = Query(100, ge=1, le=500)):
+    return search_doctors(query, ("department",), limit)
 
 
 @router.get(
     "/search/doctors/symptoms",
+    dependencies=[Depends(limit_by_ip(symptoms_limiter))],
 )
 async def search_doctor_by_symptoms(symptoms: str):
-    collection = database["users"]
-    staffs = await collection.find({"role": "doctor", "active": True}).to_list(100)
-    
-    id = get_doctor_id(symptoms, str(staffs))
+    try:
+        doctor_id = await match_doctor(symptoms)
+    except SymptomMatchUnavailable as e:
+        raise HTTPException(503, detail=str(e))
 
-    if id == "None":
+    doctor = doctor_index.get(doctor_id) if doctor_id else None
+    if doctor is None:
         raise HTTPException(404, detail="No doctor found")
 
-    for staff in staffs:
-        if staff["id"] == id:
-            return Staff(**staff)
+    return Staff(**doctor)
+
 
-    raise HTTPException(404, detail="No doctor found")
+@app.on_event("shutdown")
+async def close_symptom_pool():
+    shutdown_symptom_pool()
 
 
 app.include_router(router)
@@ -1,15 +1,41 @@
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 
 from src.app import app, database
-from src.models import Access, Announcement, Hospital, LeaveRequest, Review, Role, Staff, Patient
-from src.utils import Authentication
-from src.utils.email import send_smtp_email
+from src.models import Access, Announcement, Hospital, LeaveRequest, Review, Role, Staff
+from src.utils import Authentication, Principal
+from src.utils.availability import (
+    DEFAULT_WORKING_HOURS,
+    MAX_RANGE,
+    WORKING_HOURS_TIMEZONE,
+    availability_cache,
+    day_bounds,
+    free_slots,
+    local_day,
+    parse_slot,
+    parse_time,
+    working_windows,
+)
+from src.utils.booking import (
+    CONFLICT_INDEX,
+    DATE_FORMAT,
+    INACTIVE_STATUSES,
+    SLOT_MINUTES,
+    as_datetime,
+    parse_date,
+    with_legacy_dates,
+)
+from src.utils.geo import geo_point, valid_coordinates
+from src.utils.outbox import enqueue_email, enqueue_emails
+from src.utils.passwords import hash_password
+from src.utils.rollups import record_rollups
+from src.utils.search_index import doctor_index
 import uuid
 
 with open("src/utils/email-body-account-created.txt", "r") as f:
@@ -40,6 +66,29 @@ async def log(admin_id: str, message: str):
     )
 
 
+async def resolve_admin_hospital(principal: Principal) -> tuple[str, str]:
+    # Doctor tokens carry their own hospital_id too, but only an admin owns one.
+    if principal.role != "admin":
+        raise HTTPException(status_code=404, detail="Hospital not found")
+
+    # Tokens carry both ids; only ones issued before that (or before the
+    # admin's hospital existed) need the lookups.
+    if principal.id and principal.hospital_id:
+        return principal.id, principal.hospital_id
+
+    admin_id = principal.id
+    if not admin_id:
+        admin = await database["users"].find_one(
+            {"email_address": principal.email_address, "role": "admin"}, {"_id": 1}
+        )
+        admin_id = admin["_id"] if admin else ""
+
+    hospital = await database["hospitals"].find_one({"admin_id": admin_id}, {"id": 1})
+    if hospital is None:
+        raise HTTPException(status_code=404, detail="Hospital not found")
+    return admin_id, hospital["id"]
+
+
 @router.get("/hospital/{admin_id}/logs")
 async def fetch_hospital_logs(admin_id: str):
     collection = database["hospitals"]
@@ -51,40 +100,35 @@ async def fetch_hospital_logs(admin_id: str):
     "/staff/create",
     dependencies=[Depends(Authentication.access_required(Access.CREATE_STAFF))],
 )
-async def create_doctor(request: Request, staff: Staff):
+async def create_doctor(
+    staff: Staff, principal: Principal = Depends(Authentication.get_principal)
+):
     collection = database["users"]
 
-    token = request.headers.get("Authorization").split(" ")[1]
-    current_user = Authentication.get_current_user(token)
-
     user = await collection.find_one(
         {"email_address": staff.email_address, "role": "doctor"}
     )
     if user is not None:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    admin = await collection.find_one({"email_address": current_user["sub"]})
-    hospital = await database["hospitals"].find_one({"admin_id": admin["_id"]})
-    if hospital is None:
-        raise HTTPException(status_code=404, detail="Hospital not found")
-
-    hospital_obj = Hospital.model_validate(hospital)
+    admin_id, hospital_id = await resolve_admin_hospital(principal)
 
     sendable = staff.model_dump(mode="json")
     sendable["_id"] = sendable["id"]
-    sendable["hospital_id"] = hospital_obj.id
+    sendable["hospital_id"] = hospital_id
+    sendable["password"] = await hash_password(staff.password)
 
     await asyncio.gather(
-        send_smtp_email(
+        enqueue_email(
             sendable["email_address"],
             "Account Created",
-            EMAIL_BODY_ACCOUNT_CREATED.format(
-                sendable["email_address"], sendable["password"]
-            ),
+            EMAIL_BODY_ACCOUNT_CREATED.format(sendable["email_address"], staff.password),
+            sensitive=True,
         ),
         collection.insert_one(sendable),
-        log(hospital["admin_id"], f"You added doctor: {staff.first_name}"),
+        log(admin_id, f"You added doctor: {staff.first_name}"),
     )
+    doctor_index.add(sendable)
 
     return Staff.model_validate(sendable)
 
@@ -102,22 +146,96 @@ async def get_doctor(doctor_id: str) -> Staff:
     return Staff.model_validate(doctor)
 
 
+@router.get(
+    "/staff/{doctor_id}/availability",
+    dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
+)
+async def get_availability(
+    doctor_id: str,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    slot: str = "30m",
+):
+    try:
+        start = parse_date(from_date)
+        end = parse_date(to_date)
+        slot_length = parse_slot(slot)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if start >= end or end - start > MAX_RANGE:
+        raise HTTPException(status_code=400, detail="Invalid date range")
+    if slot_length % timedelta(minutes=SLOT_MINUTES):
+        raise HTTPException(
+            status_code=400, detail=f"Slot length must be a multiple of {SLOT_MINUTES} minutes"
+        )
+
+    cache_key = (start, end, slot_length)
+    cached = availability_cache.get(doctor_id, cache_key)
+    if cached is not None:
+        return cached
+
+    doctor, leave_requests, appointments = await asyncio.gather(
+        database["users"].find_one({"_id": doctor_id}, {"working_hours": 1}),
+        database["leave_requests"]
+        .find({"doctor_id": doctor_id, "approved": True}, {"dates": 1})
+        .to_list(None),
+        database["appointments"]
+        .find(
+            {
+                "doctor_id": doctor_id,
+                **with_legacy_dates({"end_date": {"$gt": start}, "start_date": {"$lt": end}}),
+                "cancelled": {"$ne": True},
+                "status": {"$nin": INACTIVE_STATUSES},
+            },
+            {"start_date": 1, "end_date": 1},
+            hint=CONFLICT_INDEX,
+        )
+        .to_list(None),
+    )
+    if doctor is None:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+
+    working_hours = doctor.get("working_hours") or {}
+    try:
+        start_time = parse_time(working_hours.get("start_time") or DEFAULT_WORKING_HOURS[0])
+        end_time = parse_time(working_hours.get("end_time") or DEFAULT_WORKING_HOURS[1])
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    leave_days = {
+        local_day(as_datetime(date)).isoformat()
+        for leave_request in leave_requests
+        for date in leave_request.get("dates", [])
+    }
+    windows = working_windows(start, end, start_time, end_time, leave_days)
+    busy = [
+        (as_datetime(appointment["start_date"]), as_datetime(appointment["end_date"]))
+        for appointment in appointments
+    ]
+
+    availability = {
+        "doctor_id": doctor_id,
+        "slot_minutes": int(slot_length.total_seconds() // 60),
+        "working_hours_timezone": str(WORKING_HOURS_TIMEZONE),
+        "slots": [
+            {"start_date": slot_start.strftime(DATE_FORMAT), "end_date": slot_end.strftime(DATE_FORMAT)}
+            for slot_start, slot_end in free_slots(
+                windows, busy, slot_length, timedelta(minutes=SLOT_MINUTES)
+            )
+        ],
+    }
+    availability_cache.set(doctor_id, cache_key, availability)
+    return availability
+
+
 @router.post(
     "/staff/{doctor_id}/leave-request",
     dependencies=[Depends(Authentication.access_required(Access.UPDATE_STAFF))],
 )
 async def apply_for_request(leave_request: LeaveRequest):
     collection = database["leave_requests"]
-    await collection.insert_one(
-        {
-            "_id": leave_request.id,
-            "doctor_id": leave_request.doctor_id,
-            "dates": leave_request.dates,
-            "reason": leave_request.reason,
-            "approved": leave_request.approved,
-            "created_at": leave_request.created_at
-        },
-    )
+    await collection.insert_one(leave_request.to_document())
 
     return {"success": True}
 
@@ -144,61 +262,78 @@ async def get_leave_request(doctor_id: str):
 async def approve_request(leave_request: LeaveRequest):
     collection = database["leave_requests"]
 
-    data = await collection.update_one(
-        {"doctor_id": leave_request.doctor_id}, {"$set": {"approved": True}}
+    updated_request = await collection.find_one_and_update(
+        {"_id": leave_request.id},
+        {"$set": {"approved": True}},
+        return_document=ReturnDocument.AFTER,
     )
-    staff = await collection.find_one(
-        {"_id": leave_request.doctor_id}
-    )
-
-    try:
-        await send_smtp_email(
-            to_email=staff["email_address"],
-            subject="Leave Approved",
-            body=f"Admin approved your leave request.",
+    # No fallback on a miss: approving cancels that leave's appointments, so a
+    # stale id must not approve some other request. Clients refetch the ids.
+    if updated_request is None:
+        raise HTTPException(status_code=404, detail="Leave request not found")
+
+    doctor_id = updated_request["doctor_id"]
+    availability_cache.invalidate(doctor_id)
+
+    leave_days = {local_day(as_datetime(date)) for date in updated_request["dates"]}
+    appointments = []
+    if leave_days:
+        appointments = await database["appointments"].find(
+            {
+                "doctor_id": doctor_id,
+                "$or": [
+                    with_legacy_dates({"start_date": {"$gte": day_start, "$lt": day_end}})
+                    for day_start, day_end in map(day_bounds, leave_days)
+                ],
+                "cancelled": {"$ne": True},
+                "status": {"$nin": INACTIVE_STATUSES},
+            },
+            {"patient_id": 1, "start_date": 1},
+        ).to_list(None)
+
+    appointment_ids = [appointment["_id"] for appointment in appointments]
+    if appointment_ids:
+        await database["appointments"].update_many(
+            {"_id": {"$in": appointment_ids}},
+            {
+                "$set": {
+                    "cancelled": True,
+                    "doctor_id": "",
+                    "patient_id": "",
+                    "cancelled_doctor_id": doctor_id,
+                }
+            },
+        )
+        await database["appointment_slots"].delete_many(
+            {"appointment_id": {"$in": appointment_ids}}
+        )
+        await record_rollups(
+            [(doctor_id, appointment["start_date"], {"cancelled": 1}) for appointment in appointments]
         )
-    except Exception:
-        pass
-
-    updated_request = await collection.find_one(
-        {"doctor_id": leave_request.doctor_id}
-    )
-
-    appointments = await database["appointments"].find({"doctor_id": leave_request.doctor_id}).to_list(100)
-    leave_dates = {date_string[:10] for date_string in updated_request["dates"]}
-
-    print("Leave Dates", leave_dates)
-
-    for date_string in updated_request["dates"]:
-        # Date String: "%Y-%m-%dT%H:%M:%SZ"
-
-        for appointment_data in appointments:
-            start_date_string = appointment_data["start_date"]
-            start_date_only = start_date_string[:10]
-            print("Start date", start_date_only)
-            if start_date_only in leave_dates:
-                appointment = await database["appointments"].find_one({"_id": appointment_data["_id"], "razorpay_payment_id": {"$exists": True}})
-                if not appointment:
-                    raise HTTPException(status_code=404, detail="Appointment not found")
-
-                await database["appointments"].update_one(
-                    {"_id": appointment_data["_id"]}, {"$set": {"cancelled": True, "doctor_id": "", "patient_id": ""}}
-                )
 
-                # razorpay_client.payment.refund("pay_" + appointment["razorpay_payment_id"].split("_")[1])
+    # razorpay_client.payment.refund(...) per appointment once refunds are enabled
 
-                try:
-                    patient_data = await database["users"].find_one({"_id": appointment["patient_id"]})
-                    patient = Patient(**patient_data)
+    patient_ids = list({appointment["patient_id"] for appointment in appointments})
+    staff, patients = await asyncio.gather(
+        database["users"].find_one({"_id": doctor_id}, {"email_address": 1}),
+        database["users"]
+        .find({"_id": {"$in": patient_ids}}, {"email_address": 1})
+        .to_list(None),
+    )
 
-                    if patient:
-                        await send_smtp_email(
-                            to_email=patient.email_address,
-                            subject="Appointment Cancelled",
-                            body=f"Your appointment with has been cancelled. Refund initiated.",
-                        )
-                except Exception:
-                    pass
+    emails = [
+        (
+            patient["email_address"],
+            "Appointment Cancelled",
+            "Your appointment with has been cancelled. Refund initiated.",
+        )
+        for patient in patients
+    ]
+    if staff is not None:
+        emails.append(
+            (staff["email_address"], "Leave Approved", "Admin approved your leave request.")
+        )
+    await enqueue_emails(emails)
 
     return {"success": True}
 
@@ -215,27 +350,26 @@ async def fetch_leave_requests(admin_id: str):
 
     leave_requests = await database["leave_requests"].find({"doctor_id": {"$in": staff_ids}}).to_list(100)
 
-    return leave_requests
+    # Admin clients read the `_id` key of the raw documents this used to return.
+    payloads = []
+    for leave_request in leave_requests:
+        payload = LeaveRequest.model_validate(leave_request).model_dump(mode="json")
+        payload["_id"] = payload["id"]
+        payloads.append(payload)
+    return payloads
 
 @router.get(
     "/staff",
     dependencies=[Depends(Authentication.access_required(Access.READ_STAFF))],
 )
-async def get_staff(request: Request, limit: int = 100) -> list[Staff]:
+async def get_staff(
+    limit: int = 100, principal: Principal = Depends(Authentication.get_principal)
+) -> list[Staff]:
     collection = database["users"]
-    token = request.headers.get("Authorization").split(" ")[1]
-    current_user = Authentication.get_current_user(token)
-
-    admin = await collection.find_one({"email_address": current_user["sub"]})
-    hospital = await database["hospitals"].find_one({"admin_id": admin["_id"]})
-
-    if hospital is None:
-        raise HTTPException(status_code=404, detail="Hospital not found")
-
-    hospital_obj = Hospital.model_validate(hospital)
+    _, hospital_id = await resolve_admin_hospital(principal)
 
     staff = await collection.find(
-        {"role": "doctor", "hospital_id": hospital_obj.id, "active": True}
+        {"role": "doctor", "hospital_id": hospital_id, "active": True}
     ).to_list(limit)
     return [Staff.model_validate(doctor) for doctor in staff]
 
@@ -243,16 +377,20 @@ async def get_staff(request: Request, limit: int = 100) -> list[Staff]:
 @router.put(
     "/staff/{doctor_id}",
     dependencies=[
-        Depends(Authentication.access_required(Access.UPDATE_STAFF)),
-        Depends(Authentication.access_required(Access.READ_STAFF)),
+        Depends(Authentication.access_required(Access.UPDATE_STAFF, Access.READ_STAFF)),
     ],
 )
 async def update_doctor(
     request: Request, doctor_id: str, client_request: ClientRequest
 ):
     collection = database["users"]
-    assert Staff(**client_request.data)
-    await collection.update_one({"_id": doctor_id}, {"$set": client_request.data})
+    data = client_request.data
+    assert Staff(**data)
+    if "password" in data:
+        data["password"] = await hash_password(data["password"])
+    await collection.update_one({"_id": doctor_id}, {"$set": data})
+    availability_cache.invalidate(doctor_id)
+    await doctor_index.reload(doctor_id)
     return {"success": True}
 
 
@@ -263,6 +401,7 @@ async def update_doctor(
 async def delete_doctor(doctor_id: str):
     collection = database["users"]
     await collection.update_one({"_id": doctor_id}, {"$set": {"active": False}})
+    doctor_index.remove(doctor_id)
     doctor = await collection.find_one({"_id": doctor_id})
     staff = Staff(**doctor)
     hospital_data = await database["hospitals"].find_one({"id": staff.hospital_id})
@@ -317,6 +456,9 @@ async def create_hospital(hospital: Hospital):
     collection = database["hospitals"]
     sendable_data = hospital.model_dump(mode="json")
     sendable_data["_id"] = hospital.id
+    # Left unlocated, like the backfill does, rather than failing the insert.
+    if valid_coordinates(hospital.latitude, hospital.longitude):
+        sendable_data["location"] = geo_point(hospital.latitude, hospital.longitude)
 
     await collection.insert_one(sendable_data)
     await log(hospital.admin_id, f"You onboarded Hospital: {hospital.name}")
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from src.app import database
+from src.utils.booking import with_legacy_dates
+
+ANALYTICS_TTL = int(os.getenv("ANALYTICS_TTL", 60))
+# Past the TTL a cached result is still served (and refreshed in the
+# background) until it is this old; after that the caller waits.
+ANALYTICS_MAX_STALE = int(os.getenv("ANALYTICS_MAX_STALE", 600))
+BUSIEST_DOCTORS = 10
+
+
+class RefreshingCache:
+    """TTL cache that serves stale entries while refreshing them in the background."""
+
+    def __init__(self, ttl: int, max_stale: int, maxsize: int = 256):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.maxsize = maxsize
+        self._entries: dict[tuple, tuple[float, dict]] = {}
+        self._refreshing: dict[tuple, asyncio.Task] = {}
+
+    async def get(
+        self, key: tuple, compute: Callable[[], Awaitable[dict]], refresh: bool = False
+    ) -> dict:
+        entry = self._entries.get(key)
+        age = time.monotonic() - entry[0] if entry else None
+
+        if entry is None or age > self.max_stale:
+            return await self._compute(key, compute)
+
+        if refresh or age > self.ttl:
+            self.refresh(key, compute)
+        return entry[1]
+
+    def refresh(self, key: tuple, compute: Callable[[], Awaitable[dict]]):
+        if key not in self._refreshing:
+            task = asyncio.create_task(self._compute(key, compute))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _compute(self, key: tuple, compute: Callable[[], Awaitable[dict]]) -> dict:
+        value = await compute()
+        if key not in self._entries and len(self._entries) >= self.maxsize:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+        self._entries[key] = (time.monotonic(), value)
+        return value
+
+
+analytics_cache = RefreshingCache(ANALYTICS_TTL, ANALYTICS_MAX_STALE)
+
+
+async def compute_analytics(hospital_id: str, start: datetime, end: datetime) -> dict:
+    doctors = await database["users"].find(
+        {"hospital_id": hospital_id}, {"first_name": 1, "last_name": 1}
+    ).to_list(None)
+    doctor_ids = [doctor["_id"] for doctor in doctors]
+    names = {
+        doctor["_id"]: " ".join(filter(None, [doctor.get("first_name"), doctor.get("last_name")]))
+        for doctor in doctors
+    }
+
+    rollup_match = {"hospital_id": hospital_id, "day": {"$gte": start, "$lt": end}}
+    per_day, per_doctor, ratings, leaves = await asyncio.gather(
+        database["rollups"].aggregate(
+            [
+                {"$match": rollup_match},
+                {
+                    "$group": {
+                        "_id": "$day",
+                        "booked": {"$sum": "$booked"},
+                        "cancelled": {"$sum": "$cancelled"},
+                        "completed": {"$sum": "$completed"},
+                    }
+                },
+                {"$sort": {"_id": 1}},
+            ]
+        ).to_list(None),
+        database["rollups"].aggregate(
+            [
+                {"$match": rollup_match},
+                {"$group": {"_id": "$doctor_id", "booked": {"$sum": "$booked"}}},
+                {"$sort": {"booked": -1}},
+                {"$limit": BUSIEST_DOCTORS},
+            ]
+        ).to_list(None),
+        database["reviews"].aggregate(
+            [
+                {"$match": {"doctor_id": {"$in": doctor_ids}}},
+                {"$group": {"_id": "$doctor_id", "rating": {"$avg": "$stars"}, "reviews": {"$sum": 1}}},
+            ]
+        ).to_list(None),
+        database["leave_requests"].aggregate(
+            [
+                {"$match": {"doctor_id": {"$in": doctor_ids}, "approved": True}},
+                {"$unwind": "$dates"},
+                {"$match": with_legacy_dates({"dates": {"$gte": start, "$lt": end}})},
+                {"$group": {"_id": "$doctor_id", "days": {"$sum": 1}}},
+            ]
+        ).to_list(None),
+    )
+
+    booked = sum(day["booked"] for day in per_day)
+    cancelled = sum(day["cancelled"] for day in per_day)
+    leave_days = sum(leave["days"] for leave in leaves)
+    available_days = len(doctor_ids) * max((end - start).days, 1)
+
+    return {
+        "hospital_id": hospital_id,
+        "from": start,
+        "to": end,
+        "appointments_per_day": [
+            {"day": day["_id"], "booked": day["booked"], "cancelled": day["cancelled"], "completed": day["completed"]}
+            for day in per_day
+        ],
+        "busiest_doctors": [
+            {"doctor_id": doctor["_id"], "name": names.get(doctor["_id"], ""), "booked": doctor["booked"]}
+            for doctor in per_doctor
+        ],
+        "cancellation_rate": cancelled / booked if booked else 0.0,
+        "average_rating": [
+            {"doctor_id": rating["_id"], "name": names.get(rating["_id"], ""), "rating": rating["rating"], "reviews": rating["reviews"]}
+            for rating in ratings
+        ],
+        "leave_utilisation": {
+            "leave_days": leave_days,
+            "doctor_days": available_days,
+            "rate": leave_days / available_days if available_days else 0.0,
+            "per_doctor": [{"doctor_id": leave["_id"], "days": leave["days"]} for leave in leaves],
+        },
+    }
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
 import os
+import threading
+import time
 
 import jwt
+from cachetools import LRUCache
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 
@@ -11,17 +15,47 @@ from src.models import Access
 
 SECRET_KEY = os.environ["SECRET_KEY"]
 ALGORITHM = "HS256"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
+class Principal:
+    """The caller behind a verified token, shared by every request bearing it."""
+
+    __slots__ = ("payload", "id", "email_address", "role", "hospital_id", "access", "expires_at")
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.id = payload.get("uid", "")
+        self.email_address = payload.get("sub", "")
+        self.role = payload.get("role", "")
+        # Empty for tokens issued before these claims existed.
+        self.hospital_id = payload.get("hospital_id", "")
+        self.access = frozenset(payload.get("access", []))
+        self.expires_at = payload.get("exp")
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+
+# Verified claims keyed by the token's SHA-256, so raw tokens are never held.
+_verified: LRUCache[bytes, Principal] = LRUCache(TOKEN_CACHE_SIZE)
+# The sync dependencies run on FastAPI's threadpool, and LRUCache reorders
+# itself even on reads.
+_verified_lock = threading.Lock()
+
+
 class Authentication:
     @staticmethod
-    def encode(data: dict, *access: Access) -> str:
+    def encode(data: dict, *access: Access, hospital_id: str = "") -> str:
         encodable = {}
         encodable["access"] = [a.value for a in access]
         encodable["role"] = data["role"]
         encodable["sub"] = str(data["email_address"])
+        encodable["uid"] = str(data["_id"])
+        encodable["hospital_id"] = hospital_id or data.get("hospital_id", "")
 
         return jwt.encode(encodable, SECRET_KEY, ALGORITHM)
 
@@ -34,20 +68,40 @@ class Authentication:
             print("Invalid token")
             return {}
 
+    @staticmethod
+    def verify(token: str) -> Principal:
+        digest = hashlib.sha256(token.encode()).digest()
+        with _verified_lock:
+            principal = _verified.get(digest)
+        if principal is None:
+            payload = Authentication.decode(token)
+            if not payload:
+                raise HTTPException(status_code=401, detail="Invalid token")
+            principal = Principal(payload)
+            with _verified_lock:
+                _verified[digest] = principal
+
+        if principal.expired:
+            with _verified_lock:
+                _verified.pop(digest, None)
+            raise HTTPException(status_code=401, detail="Token expired")
+        return principal
+
     @staticmethod
     def get_current_user(token: str = Depends(oauth2_scheme)):
-        payload = Authentication.decode(token)
-        if not payload:
-            print("Invalid token")
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return payload
+        return Authentication.verify(token).payload
+
+    @staticmethod
+    def get_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+        return Authentication.verify(token)
 
     @staticmethod
     def access_required(*access: Access):
-        def dependency(current_user: dict = Depends(Authentication.get_current_user)):
-            user_access = current_user["access"]
-            for a in access:
-                if a.value not in user_access:
-                    raise HTTPException(status_code=403, detail="Access denied")
+        # One dependency checks every required permission with a subset test.
+        required = frozenset(a.value for a in access)
+
+        def dependency(token: str = Depends(oauth2_scheme)):
+            if not required <= Authentication.verify(token).access:
+                raise HTTPException(status_code=403, detail="Access denied")
 
         return dependency
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from cachetools import TTLCache
+
+DEFAULT_WORKING_HOURS = ("09:00", "17:00")
+# Staff working hours are clinic wall-clock times in this zone; appointments
+# and the slots returned are UTC.
+WORKING_HOURS_TIMEZONE = ZoneInfo(os.getenv("WORKING_HOURS_TIMEZONE", "Asia/Kolkata"))
+TIME_FORMATS = ["%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p"]
+MAX_RANGE = timedelta(days=31)
+
+Interval = tuple[datetime, datetime]
+
+
+def parse_time(time_string: str) -> time:
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(time_string.strip(), time_format).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time: {time_string}")
+
+
+def parse_slot(slot: str) -> timedelta:
+    match = re.fullmatch(r"(\d+)\s*(m|min|h)?", slot.strip().lower())
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid slot length: {slot}")
+
+    value = int(match.group(1))
+    return timedelta(hours=value) if match.group(2) == "h" else timedelta(minutes=value)
+
+
+def local_day(moment: datetime, zone: ZoneInfo = WORKING_HOURS_TIMEZONE) -> date:
+    """The clinic calendar day `moment` falls on; leave is taken in these days."""
+    return moment.astimezone(zone).date()
+
+
+def day_bounds(day: date, zone: ZoneInfo = WORKING_HOURS_TIMEZONE) -> Interval:
+    """UTC start and end of a clinic calendar day."""
+    start = datetime.combine(day, time(0), zone)
+    end = datetime.combine(day + timedelta(days=1), time(0), zone)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+def working_windows(
+    start: datetime,
+    end: datetime,
+    start_time: time,
+    end_time: time,
+    leave_days: set[str],
+    zone: ZoneInfo = WORKING_HOURS_TIMEZONE,
+) -> list[Interval]:
+    # Walk the clinic's local calendar days, then hand back UTC windows.
+    windows = []
+    day = start.astimezone(zone).date()
+    last_day = end.astimezone(zone).date()
+    while day <= last_day:
+        if day.isoformat() not in leave_days:
+            window_start = max(datetime.combine(day, start_time, zone), start)
+            window_end = min(datetime.combine(day, end_time, zone), end)
+            if window_start < window_end:
+                windows.append((window_start.astimezone(timezone.utc), window_end.astimezone(timezone.utc)))
+        day += timedelta(days=1)
+    return windows
+
+
+def merge_intervals(intervals: list[Interval]) -> list[Interval]:
+    merged: list[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def align_up(moment: datetime, step: timedelta) -> datetime:
+    remainder = moment.timestamp() % step.total_seconds()
+    return moment + timedelta(seconds=step.total_seconds() - remainder) if remainder else moment
+
+
+def free_slots(
+    windows: list[Interval], busy: list[Interval], slot: timedelta, step: timedelta
+) -> list[Interval]:
+    # Single sweep: windows and merged busy intervals are both sorted, so the
+    # busy pointer only ever moves forward. Slots start on the `step` grid
+    # (the booking bucket width), so every offered slot can be reserved.
+    busy = merge_intervals(busy)
+    slots = []
+    index = 0
+    for window_start, window_end in windows:
+        cursor = align_up(window_start, step)
+        while index < len(busy) and busy[index][1] <= cursor:
+            index += 1
+
+        position = index
+        while cursor + slot <= window_end:
+            if position < len(busy) and busy[position][0] < cursor + slot:
+                cursor = align_up(max(cursor, busy[position][1]), step)
+                position += 1
+                continue
+            slots.append((cursor, cursor + slot))
+            cursor += slot
+    return slots
+
+
+class AvailabilityCache:
+    """Per-doctor TTL cache of computed availability.
+
+    Entries are dropped on booking, cancellation and leave approval in this
+    process; the TTL bounds staleness for writes handled by other workers.
+    """
+
+    def __init__(self, ttl: int = 60, maxsize: int = 32, max_doctors: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._doctors: TTLCache[str, TTLCache] = TTLCache(max_doctors, ttl)
+
+    def get(self, doctor_id: str, key: tuple):
+        entries = self._doctors.get(doctor_id)
+        if entries is None:
+            return None
+        return entries.get(key)
+
+    def set(self, doctor_id: str, key: tuple, value):
+        entries = self._doctors.get(doctor_id)
+        if entries is None:
+            entries = self._doctors[doctor_id] = TTLCache(self.maxsize, self.ttl)
+        entries[key] = value
+
+    def invalidate(self, doctor_id: str):
+        self._doctors.pop(doctor_id, None)
+
+
+availability_cache = AvailabilityCache()
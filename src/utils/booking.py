@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from src.models import as_utc
+
+# Sample DateTime: 2025-04-02T06:30:00Z
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Bookings in these states no longer hold the doctor's time.
+INACTIVE_STATUSES = ["Cancelled", "Completed"]
+
+# Overlap checks lead with end_date: `end_date > start` only matches bookings
+# that have not finished yet, so the keys scanned don't grow with history.
+CONFLICT_INDEX = [("doctor_id", ASCENDING), ("end_date", ASCENDING), ("start_date", ASCENDING)]
+
+# Width of the time buckets a booking reserves in `appointment_slots`.
+# Bookings must start and end on a bucket boundary, so back-to-back
+# appointments never share a bucket.
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", 15))
+SLOT_ALIGNMENT_ERROR = f"Appointments must start and end on a {SLOT_MINUTES}-minute boundary"
+
+
+def parse_date(date_string: str) -> datetime:
+    try:
+        return as_utc(datetime.strptime(date_string, DATE_FORMAT))
+    except ValueError:
+        return as_utc(datetime.fromisoformat(date_string.replace("Z", "+00:00")))
+
+
+def as_datetime(value: datetime | str) -> datetime:
+    # Documents written before the native_datetimes migration still hold strings.
+    return parse_date(value) if isinstance(value, str) else as_utc(value)
+
+
+def with_legacy_dates(clause: dict) -> dict:
+    """Match a date range clause against native dates and legacy strings.
+
+    Mongo never compares a string with a date, so until native_datetimes has
+    run, old documents would silently drop out of range queries. DATE_FORMAT
+    strings sort chronologically, so the same bounds work as strings.
+    """
+    legacy = {
+        field: {operator: bound.strftime(DATE_FORMAT) for operator, bound in condition.items()}
+        for field, condition in clause.items()
+    }
+    return {"$or": [clause, legacy]}
+
+
+def is_slot_aligned(moment: datetime) -> bool:
+    return moment.timestamp() % (SLOT_MINUTES * 60) == 0
+
+
+async def find_conflicting_appointment(
+    collection: AsyncIOMotorCollection,
+    doctor_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    exclude_id: str | None = None,
+) -> dict | None:
+    query = {
+        "doctor_id": doctor_id,
+        **with_legacy_dates({"end_date": {"$gt": start_date}, "start_date": {"$lt": end_date}}),
+        "cancelled": {"$ne": True},
+        "status": {"$nin": INACTIVE_STATUSES},
+    }
+    if exclude_id is not None:
+        query["_id"] = {"$ne": exclude_id}
+
+    return await collection.find_one(
+        query,
+        projection={"_id": 1},
+        hint=CONFLICT_INDEX,
+    )
+
+
+def slot_keys(start_date: datetime, end_date: datetime) -> list[datetime]:
+    # Callers check is_slot_aligned first, so every bucket lies inside the booking.
+    bucket = start_date
+    keys = []
+    while bucket < end_date:
+        keys.append(bucket)
+        bucket += timedelta(minutes=SLOT_MINUTES)
+    return keys
+
+
+def slot_documents(
+    doctor_id: str, start_date: datetime, end_date: datetime, appointment_id: str
+) -> list[dict]:
+    return [
+        {"doctor_id": doctor_id, "slot": key, "appointment_id": appointment_id}
+        for key in slot_keys(start_date, end_date)
+    ]
+
+
+async def reserve_slots(
+    collection: AsyncIOMotorCollection,
+    doctor_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    appointment_id: str,
+) -> bool:
+    # The unique (doctor_id, slot) index makes the database the arbiter: of two
+    # concurrent bookings for the same bucket exactly one insert succeeds.
+    documents = slot_documents(doctor_id, start_date, end_date, appointment_id)
+    try:
+        await collection.insert_many(documents, ordered=True)
+    except BulkWriteError as e:
+        # Ordered insert stops at the first taken bucket; undo the ones before it.
+        inserted = [document["slot"] for document in documents[: e.details["nInserted"]]]
+        if inserted:
+            await collection.delete_many(
+                {"appointment_id": appointment_id, "slot": {"$in": inserted}}
+            )
+        return False
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def release_slots(collection: AsyncIOMotorCollection, appointment_id: str):
+    await collection.delete_many({"appointment_id": appointment_id})
+
+
+async def find_conflicting_appointments(
+    collection: AsyncIOMotorCollection, appointments: list
+) -> list[dict]:
+    # One $or clause per requested interval; each is answered by the same
+    # CONFLICT_INDEX as the single-booking check.
+    if not appointments:
+        return []
+    return await collection.find(
+        {
+            "$or": [
+                {
+                    "doctor_id": appointment.doctor_id,
+                    **with_legacy_dates(
+                        {
+                            "end_date": {"$gt": appointment.start_date},
+                            "start_date": {"$lt": appointment.end_date},
+                        }
+                    ),
+                }
+                for appointment in appointments
+            ],
+            "cancelled": {"$ne": True},
+            "status": {"$nin": INACTIVE_STATUSES},
+        },
+        projection={"doctor_id": 1, "start_date": 1, "end_date": 1},
+        hint=CONFLICT_INDEX,
+    ).to_list(None)
+
+
+def overlapping_ids(appointments: list, existing: list[dict]) -> dict[str, str]:
+    """Map appointment id -> reason for every requested appointment that
+    overlaps an existing booking or an earlier appointment in the same batch."""
+    conflicts: dict[str, str] = {}
+    booked: dict[str, list[tuple[datetime, datetime]]] = {}
+    for document in existing:
+        booked.setdefault(document["doctor_id"], []).append(
+            (as_datetime(document["start_date"]), as_datetime(document["end_date"]))
+        )
+
+    accepted: dict[str, list[tuple[datetime, datetime]]] = {}
+    for appointment in sorted(appointments, key=lambda a: (a.doctor_id, a.start_date)):
+        start, end = appointment.start_date, appointment.end_date
+        if any(start < b_end and end > b_start for b_start, b_end in booked.get(appointment.doctor_id, [])):
+            conflicts[appointment.id] = "Doctor is already booked for this time"
+            continue
+
+        # Sorted by start, so only the latest accepted interval can overlap.
+        previous = accepted.setdefault(appointment.doctor_id, [])
+        if previous and start < previous[-1][1]:
+            conflicts[appointment.id] = "Overlaps another appointment in this request"
+            continue
+        previous.append((start, end))
+    return conflicts
+
+
+async def reserve_slots_many(
+    collection: AsyncIOMotorCollection, appointments: list
+) -> set[str]:
+    """Reserve slots for many appointments in one write; returns the ids that
+    lost a bucket to another booking (their other buckets are released)."""
+    documents = [
+        document
+        for appointment in appointments
+        for document in slot_documents(
+            appointment.doctor_id, appointment.start_date, appointment.end_date, appointment.id
+        )
+    ]
+    if not documents:
+        return set()
+
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        failed_indexes = {error["index"] for error in e.details["writeErrors"]}
+        failed = {documents[index]["appointment_id"] for index in failed_indexes}
+        inserted = [
+            document["slot"]
+            for index, document in enumerate(documents)
+            if index not in failed_indexes and document["appointment_id"] in failed
+        ]
+        if inserted:
+            await collection.delete_many(
+                {"appointment_id": {"$in": list(failed)}, "slot": {"$in": inserted}}
+            )
+        return failed
+    return set()
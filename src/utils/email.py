@@ -1,35 +1,159 @@
+from __future__ import annotations
+
 import asyncio
 import os
-import smtplib
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+import aiosmtplib
+
 EMAIL = os.environ["EMAIL"]
 PASSWORD = os.environ["PASSWORD"]
 
+# Point these at a local debugging server (e.g. `python -m aiosmtpd -n -l
+# localhost:1025` with SMTP_STARTTLS=false) to exercise the sender offline.
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_LOGIN = os.getenv("SMTP_LOGIN", "true").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+SMTP_MAX_IDLE = int(os.getenv("SMTP_MAX_IDLE", 60))
+
+
+class SMTPPool:
+    """A small pool of authenticated SMTP sessions.
+
+    At most `size` sessions exist at once; a batch of messages is sent over a
+    single session, and idle sessions are reused until they go stale.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str | None = None,
+        password: str | None = None,
+        start_tls: bool = True,
+        size: int = 3,
+        max_idle: int = 60,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.size = size
+        self.max_idle = max_idle
+
+        self._idle: list[tuple[aiosmtplib.SMTP, float]] = []
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname, port=self.port, start_tls=self.start_tls, timeout=30
+        )
+        await client.connect()
+        if self.username and self.password:
+            await client.login(self.username, self.password)
+        return client
+
+    def _acquire(self) -> aiosmtplib.SMTP | None:
+        while self._idle:
+            client, last_used = self._idle.pop()
+            if client.is_connected and time.monotonic() - last_used < self.max_idle:
+                return client
+            client.close()
+        return None
+
+    def _release(self, client: aiosmtplib.SMTP | None):
+        if client is None:
+            return
+        if client.is_connected and len(self._idle) < self.size:
+            self._idle.append((client, time.monotonic()))
+        else:
+            client.close()
+
+    async def send_many(self, messages: list[MIMEMultipart]) -> list[bool]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+
+        results = []
+        async with self._semaphore:
+            client = self._acquire()
+            try:
+                for message in messages:
+                    sent, client = await self._send(client, message)
+                    results.append(sent)
+            finally:
+                self._release(client)
+        return results
+
+    async def _send(
+        self, client: aiosmtplib.SMTP | None, message: MIMEMultipart
+    ) -> tuple[bool, aiosmtplib.SMTP | None]:
+        # A pooled session may have been dropped by the server; reconnect once.
+        for attempt in range(2):
+            try:
+                if client is None or not client.is_connected:
+                    client = await self._connect()
+                await client.send_message(message)
+                return True, client
+            except aiosmtplib.SMTPServerDisconnected as e:
+                client = None
+                if attempt:
+                    print(f"Email sending failed: {e}")
+            except (aiosmtplib.SMTPException, OSError) as e:
+                print(f"Email sending failed: {e}")
+                return False, client
+        return False, client
+
+    async def send(self, message: MIMEMultipart) -> bool:
+        return (await self.send_many([message]))[0]
+
+    async def close(self):
+        while self._idle:
+            client, _ = self._idle.pop()
+            try:
+                await client.quit()
+            except aiosmtplib.SMTPException:
+                client.close()
+
+
+smtp_pool = SMTPPool(
+    SMTP_HOST,
+    SMTP_PORT,
+    username=EMAIL if SMTP_LOGIN else None,
+    password=PASSWORD if SMTP_LOGIN else None,
+    start_tls=SMTP_STARTTLS,
+    size=SMTP_POOL_SIZE,
+    max_idle=SMTP_MAX_IDLE,
+)
+
+
+def build_message(to_email: str, subject: str, body: str) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg["From"] = EMAIL
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body, "plain"))
+    return msg
+
 
 async def send_smtp_email(to_email: str, subject: str, body: str):
-    try:
-        msg = MIMEMultipart()
-        msg["From"] = EMAIL
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(body, "plain"))
-
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, sync_send_email, msg, to_email)
-        return True
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
-
-
-def sync_send_email(msg, to_email):
-    try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(EMAIL, PASSWORD)
-        server.sendmail(EMAIL, to_email, msg.as_string())
-        server.quit()
-    except Exception as e:
-        print(f"Sync email sending failed: {e}")
+    return await smtp_pool.send(build_message(to_email, subject, body))
+
+
+async def send_smtp_emails(emails: list[tuple[str, str, str]]) -> list[bool]:
+    messages = [build_message(*email) for email in emails]
+    if not messages:
+        return []
+
+    # One batch per pooled session, sent concurrently.
+    batches = [messages[i :: smtp_pool.size] for i in range(min(smtp_pool.size, len(messages)))]
+    results = await asyncio.gather(*(smtp_pool.send_many(batch) for batch in batches))
+
+    ordered = [False] * len(messages)
+    for offset, batch_results in enumerate(results):
+        ordered[offset :: smtp_pool.size] = batch_results
+    return ordered
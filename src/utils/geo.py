@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from src.app import database
+
+MAX_RADIUS_KM = 500
+
+
+def valid_coordinates(latitude: float, longitude: float) -> bool:
+    # The 2dsphere index rejects documents with points outside these ranges.
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def geo_point(latitude: float, longitude: float) -> dict:
+    # GeoJSON orders coordinates longitude first.
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def near_stage(latitude: float, longitude: float, radius_km: float, query: dict | None = None) -> dict:
+    """A $geoNear stage over the 2dsphere index on hospitals.location, nearest first."""
+    return {
+        "$geoNear": {
+            "near": geo_point(latitude, longitude),
+            "key": "location",
+            "distanceField": "distance",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "query": query or {},
+        }
+    }
+
+
+async def hospital_distances(latitude: float, longitude: float, radius_km: float) -> dict[str, float]:
+    """Hospital id -> distance in km for every hospital within the radius."""
+    hospitals = await database["hospitals"].aggregate(
+        [near_stage(latitude, longitude, radius_km), {"$project": {"distance": 1}}]
+    ).to_list(None)
+    return {hospital["_id"]: hospital["distance"] / 1000 for hospital in hospitals}
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from cachetools import TTLCache
+from pymongo import ReturnDocument
+
+from src.app import database
+
+SECRET_KEY = os.environ["SECRET_KEY"]
+
+OTP_EXPIRY_TIME = 300
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))
+OTP_RESEND_INTERVAL = int(os.getenv("OTP_RESEND_INTERVAL", 30))
+OTP_CACHE_SIZE = int(os.getenv("OTP_CACHE_SIZE", 10_000))
+
+
+def otp_digest(email: str, otp: int) -> str:
+    return hmac.new(SECRET_KEY.encode(), f"{email}:{otp}".encode(), hashlib.sha256).hexdigest()
+
+
+class OTPStore:
+    """One-time passwords in the TTL-indexed `otps` collection.
+
+    Only a keyed digest of the code is stored, each code allows
+    OTP_MAX_ATTEMPTS guesses, and Mongo expires entries on its own. The
+    bounded in-process cache remembers recent issues to throttle resends
+    without a read, so memory stays capped however many addresses are spammed.
+    """
+
+    def __init__(self):
+        self._recent: TTLCache[str, bool] = TTLCache(OTP_CACHE_SIZE, OTP_RESEND_INTERVAL)
+
+    async def issue(self, email: str) -> int | None:
+        if email in self._recent:
+            return None
+
+        otp = 100000 + secrets.randbelow(900000)
+        await database["otps"].replace_one(
+            {"_id": email},
+            {
+                "_id": email,
+                "digest": otp_digest(email, otp),
+                "attempts": 0,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=OTP_EXPIRY_TIME),
+            },
+            upsert=True,
+        )
+        self._recent[email] = True
+        return otp
+
+    async def verify(self, email: str, otp: int) -> bool | None:
+        """True on match, False on a wrong code, None if there is no live code
+        (never issued, expired, or out of attempts)."""
+        # The TTL monitor runs about once a minute, so expiry is checked here too.
+        document = await database["otps"].find_one_and_update(
+            {
+                "_id": email,
+                "expires_at": {"$gt": datetime.now(timezone.utc)},
+                "attempts": {"$lt": OTP_MAX_ATTEMPTS},
+            },
+            {"$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            return None
+
+        if not hmac.compare_digest(document["digest"], otp_digest(email, otp)):
+            return False
+
+        await database["otps"].delete_one({"_id": email})
+        self._recent.pop(email, None)
+        return True
+
+
+otp_store = OTPStore()
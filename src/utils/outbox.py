@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+from src.app import database
+
+from .email import send_smtp_emails
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BACKOFF = int(os.getenv("OUTBOX_BACKOFF", 30))
+OUTBOX_POLL_INTERVAL = int(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+
+# A claimed batch not settled within this long (worker died mid-send) is retried.
+OUTBOX_LEASE = 300
+
+
+def outbox_document(to_email: str, subject: str, body: str, sensitive: bool = False) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": str(uuid.uuid4()),
+        "to_email": to_email,
+        "subject": subject,
+        "body": body,
+        # Sensitive bodies (new-account passwords) are blanked once settled.
+        "sensitive": sensitive,
+        "status": "pending",
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now,
+    }
+
+
+async def enqueue_email(to_email: str, subject: str, body: str, sensitive: bool = False):
+    await database["email_outbox"].insert_one(outbox_document(to_email, subject, body, sensitive))
+    outbox_worker.notify()
+
+
+async def enqueue_emails(emails: list[tuple[str, str, str]]):
+    if not emails:
+        return
+    await database["email_outbox"].insert_many([outbox_document(*email) for email in emails])
+    outbox_worker.notify()
+
+
+class OutboxWorker:
+    """Drains `email_outbox` in batches.
+
+    Failed sends are retried with exponential backoff; after
+    OUTBOX_MAX_ATTEMPTS a message is parked with status "dead".
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.drain_once()
+            except Exception as e:
+                print(f"Outbox drain failed: {e}")
+                processed = 0
+
+            if processed < OUTBOX_BATCH_SIZE:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_once(self) -> int:
+        collection = database["email_outbox"]
+        now = datetime.now(timezone.utc)
+        claimable = {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "claimed_at": {"$lt": now - timedelta(seconds=OUTBOX_LEASE)}},
+            ]
+        }
+
+        candidates = await collection.find(claimable, {"_id": 1}).limit(OUTBOX_BATCH_SIZE).to_list(None)
+        if not candidates:
+            return 0
+
+        # Claiming is a conditional update, so concurrent workers never send
+        # the same message twice.
+        claim = str(uuid.uuid4())
+        await collection.update_many(
+            {"_id": {"$in": [c["_id"] for c in candidates]}, **claimable},
+            {"$set": {"status": "sending", "claim": claim, "claimed_at": now}},
+        )
+        messages = await collection.find({"claim": claim, "status": "sending"}).to_list(None)
+        if not messages:
+            return 0
+
+        results = await send_smtp_emails(
+            [(message["to_email"], message["subject"], message["body"]) for message in messages]
+        )
+
+        sent_at = datetime.now(timezone.utc)
+        operations = []
+        for message, sent in zip(messages, results):
+            # Credential-bearing bodies go as soon as the message is settled
+            # either way; every other dead letter keeps its body for replay.
+            scrub = {"body": ""} if message.get("sensitive") else {}
+            if sent:
+                update = {"$set": {"status": "sent", "sent_at": sent_at, **scrub}}
+            else:
+                attempts = message["attempts"] + 1
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    update = {"$set": {"status": "dead", "attempts": attempts, **scrub}}
+                else:
+                    retry_at = sent_at + timedelta(seconds=OUTBOX_BACKOFF * 2 ** (attempts - 1))
+                    update = {
+                        "$set": {"status": "pending", "attempts": attempts, "next_attempt_at": retry_at}
+                    }
+            operations.append(UpdateOne({"_id": message["_id"], "claim": claim}, update))
+
+        await collection.bulk_write(operations, ordered=False)
+        return len(messages)
+
+
+outbox_worker = OutboxWorker()
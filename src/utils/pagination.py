@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+from src.models import as_utc
+
+
+def encode_cursor(sort_value: datetime, document_id: str) -> str:
+    payload = json.dumps([sort_value.isoformat(), document_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, document_id = json.loads(base64.urlsafe_b64decode(padded))
+        return as_utc(datetime.fromisoformat(sort_value)), document_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(field: str, cursor: str) -> dict:
+    # Rows strictly after the cursor in (field, _id) order.
+    sort_value, document_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {field: {"$gt": sort_value}},
+            {field: sort_value, "_id": {"$gt": document_id}},
+        ]
+    }
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", 2))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Hashes waiting for a worker beyond this many make callers wait in asyncio,
+# not in the executor's unbounded queue.
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", 4 * PASSWORD_WORKERS))
+
+_executor: ProcessPoolExecutor | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+def is_hashed(password: str) -> bool:
+    return password.startswith(("$2a$", "$2b$", "$2y$"))
+
+
+async def _run(function, *args):
+    global _executor, _semaphore
+    if _executor is None:
+        # Spawned, not forked: the parent already runs Motor's threads.
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+        _semaphore = asyncio.Semaphore(PASSWORD_QUEUE_LIMIT)
+
+    async with _semaphore:
+        return await asyncio.get_running_loop().run_in_executor(_executor, function, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    # Accounts created before hashing still hold the plaintext; login rehashes them.
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    return await _run(_check, password, stored)
+
+
+def shutdown_password_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from pymongo import UpdateOne
+
+from src.app import RAZORPAY_KEY, RAZORPAY_SECRET, database
+
+# Override to run against a local fake gateway.
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL", "https://api.razorpay.com/v1")
+RAZORPAY_TIMEOUT = float(os.getenv("RAZORPAY_TIMEOUT", 10))
+RAZORPAY_CONCURRENCY = int(os.getenv("RAZORPAY_CONCURRENCY", 10))
+
+# Non-terminal payment links are re-fetched once their cached copy is older
+# than this; terminal ones never change again and are kept for good.
+PAYMENT_LINK_TTL = int(os.getenv("PAYMENT_LINK_TTL", 300))
+TERMINAL_STATUSES = {"paid", "cancelled", "expired"}
+
+
+class RazorpayGateway:
+    """Async access to the Razorpay REST API over one pooled HTTP client.
+
+    Concurrent calls are capped at `concurrency`, matching the connection pool
+    size, and every call is bounded by `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        key: str | None,
+        secret: str | None,
+        base_url: str = RAZORPAY_BASE_URL,
+        timeout: float = RAZORPAY_TIMEOUT,
+        concurrency: int = RAZORPAY_CONCURRENCY,
+    ):
+        self.key = key
+        self.secret = secret
+        self.base_url = base_url
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=(self.key or "", self.secret or ""),
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        client = self.client
+        async with self._semaphore:
+            response = await asyncio.wait_for(
+                client.request(method, path, **kwargs), self.timeout
+            )
+        response.raise_for_status()
+        return response.json()
+
+    async def create_payment_link(self, payload: dict) -> dict:
+        return await self._request("POST", "/payment_links", json=payload)
+
+    async def fetch_payment_link(self, payment_link_id: str) -> dict:
+        return await self._request("GET", f"/payment_links/{payment_link_id}")
+
+    async def fetch_payment_links(self, payment_link_ids: list[str]) -> list[dict | None]:
+        # Failed fetches come back as None so one bad link doesn't fail a listing.
+        results = await asyncio.gather(
+            *(self.fetch_payment_link(link_id) for link_id in payment_link_ids),
+            return_exceptions=True,
+        )
+        payloads = []
+        for link_id, result in zip(payment_link_ids, results):
+            if isinstance(result, BaseException):
+                print(f"Payment link fetch failed for {link_id}: {result!r}")
+                payloads.append(None)
+            else:
+                payloads.append(result)
+        return payloads
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+razorpay_gateway = RazorpayGateway(RAZORPAY_KEY, RAZORPAY_SECRET)
+
+
+def is_fresh(document: dict, now: datetime) -> bool:
+    if document.get("status") in TERMINAL_STATUSES:
+        return True
+    return document["fetched_at"] > now - timedelta(seconds=PAYMENT_LINK_TTL)
+
+
+async def store_payment_links(payloads: list[dict]):
+    if not payloads:
+        return
+    now = datetime.now(timezone.utc)
+    await database["payment_links"].bulk_write(
+        [
+            UpdateOne(
+                {"_id": payload["id"]},
+                {"$set": {"status": payload.get("status"), "payload": payload, "fetched_at": now}},
+                upsert=True,
+            )
+            for payload in payloads
+        ],
+        ordered=False,
+    )
+
+
+async def get_payment_links(payment_link_ids: list[str]) -> list[dict | None]:
+    """Payment link payloads in `payment_link_ids` order, served from the
+    `payment_links` cache; only missing or stale non-terminal links hit the
+    gateway. A link whose refresh fails falls back to its last cached copy."""
+    now = datetime.now(timezone.utc)
+    cached = {
+        document["_id"]: document
+        async for document in database["payment_links"].find({"_id": {"$in": payment_link_ids}})
+    }
+
+    stale = [
+        link_id
+        for link_id in dict.fromkeys(payment_link_ids)
+        if link_id not in cached or not is_fresh(cached[link_id], now)
+    ]
+    fetched = {}
+    if stale:
+        for link_id, payload in zip(stale, await razorpay_gateway.fetch_payment_links(stale)):
+            if payload is not None:
+                fetched[link_id] = payload
+        await store_payment_links(list(fetched.values()))
+
+    payloads = []
+    for link_id in payment_link_ids:
+        if link_id in fetched:
+            payloads.append(fetched[link_id])
+        elif link_id in cached:
+            payloads.append(cached[link_id]["payload"])
+        else:
+            payloads.append(None)
+    return payloads
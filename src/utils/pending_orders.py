@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+
+from cachetools import TTLCache
+
+from src.app import database
+from src.models import Appointment
+
+# Razorpay payment links stay payable for a while; keep the order at least as long.
+PENDING_ORDER_TTL = int(os.getenv("PENDING_ORDER_TTL", 24 * 3600))
+PENDING_ORDER_CACHE_SIZE = int(os.getenv("PENDING_ORDER_CACHE_SIZE", 1024))
+
+
+class PendingOrderStore:
+    """Appointments awaiting payment, keyed by payment link id.
+
+    Mongo (`pending_orders`, TTL-indexed on `created_at`) is the source of
+    truth so the verify-payment callback can land on any worker; a small
+    LRU in front saves the read when it lands on the worker that took the order.
+    """
+
+    def __init__(self, maxsize: int = PENDING_ORDER_CACHE_SIZE, ttl: int = PENDING_ORDER_TTL):
+        self._cache: TTLCache[str, Appointment] = TTLCache(maxsize, ttl)
+
+    async def put(self, order_id: str, appointment: Appointment):
+        await database["pending_orders"].replace_one(
+            {"_id": order_id},
+            {
+                "_id": order_id,
+                "appointment": appointment.to_document(),
+                "created_at": datetime.now(timezone.utc),
+            },
+            upsert=True,
+        )
+        self._cache[order_id] = appointment
+
+    async def get(self, order_id: str) -> Appointment | None:
+        appointment = self._cache.get(order_id)
+        if appointment is not None:
+            return appointment
+
+        document = await database["pending_orders"].find_one({"_id": order_id})
+        if document is None:
+            return None
+
+        appointment = Appointment.model_validate(document["appointment"])
+        self._cache[order_id] = appointment
+        return appointment
+
+
+pending_orders = PendingOrderStore()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from cachetools import TTLCache
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+from src.app import database
+
+# "memory" keeps buckets per worker; "mongo" shares them across workers.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", 16))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+# Only trust X-Forwarded-For when a proxy we control sets it.
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+
+
+class RateLimiter:
+    """Token bucket: `capacity` requests in a burst, refilled over `period` seconds.
+
+    Buckets are spread over sharded locks so unrelated keys never contend; an
+    idle bucket is evicted once it would have refilled, which is the same as a
+    fresh one, so memory only tracks recently active keys.
+    """
+
+    def __init__(self, name: str, capacity: int, period: float, backend: str = RATE_LIMIT_BACKEND):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.backend = backend
+        self._shards = [
+            (threading.Lock(), TTLCache(max(RATE_LIMIT_MAX_KEYS // RATE_LIMIT_SHARDS, 1), period))
+            for _ in range(RATE_LIMIT_SHARDS)
+        ]
+
+    async def acquire(self, key: str) -> float:
+        """Take a token for `key`; returns 0 if allowed, else seconds until one is free."""
+        if self.backend == "mongo":
+            return await self._acquire_shared(key)
+        return self._acquire_local(key)
+
+    def _acquire_local(self, key: str) -> float:
+        lock, buckets = self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated_at = buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return 0.0 if allowed else (1 - tokens) / self.rate
+
+    async def _acquire_shared(self, key: str) -> float:
+        now = datetime.now(timezone.utc)
+        tokens = {"$ifNull": ["$tokens", self.capacity]}
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+
+        # Refill, test and take in one pipeline update so workers never race.
+        bucket = await database["rate_limits"].find_one_and_update(
+            {"_id": f"{self.name}:{key}"},
+            [
+                {"$set": {"tokens": {"$min": [self.capacity, {"$add": [tokens, {"$multiply": [elapsed, self.rate]}]}]}}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {
+                    "$set": {
+                        "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                        "updated_at": now,
+                        "expires_at": now + timedelta(seconds=self.capacity / self.rate),
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / self.rate
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def enforce(limiter: RateLimiter, key: str):
+    retry_after = await limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(int(retry_after + 0.999), 1))},
+        )
+
+
+def limit_by_ip(limiter: RateLimiter):
+    async def dependency(request: Request):
+        await enforce(limiter, client_ip(request))
+
+    return dependency
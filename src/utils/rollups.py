@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from src.app import database
+from src.utils.booking import as_datetime
+
+# (doctor_id, appointment start, counters to $inc)
+RollupEvent = tuple[str, datetime, dict[str, int]]
+
+COUNTERS = ["booked", "cancelled", "completed", "paid_amount"]
+
+
+def rollup_day(date: datetime | str) -> datetime:
+    return as_datetime(date).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def record_rollups(events: list[RollupEvent]):
+    """Apply counter increments to the per (hospital, doctor, day) rollups.
+
+    Appointments are bucketed by the day they take place, so a cancellation
+    lands in the same row as the booking it undoes.
+    """
+    events = [event for event in events if event[0]]
+    if not events:
+        return
+
+    doctor_ids = list({doctor_id for doctor_id, _, _ in events})
+    hospitals = {
+        user["_id"]: user.get("hospital_id", "")
+        async for user in database["users"].find(
+            {"_id": {"$in": doctor_ids}}, {"hospital_id": 1}
+        )
+    }
+
+    await database["rollups"].bulk_write(
+        [
+            UpdateOne(
+                {
+                    "hospital_id": hospitals.get(doctor_id, ""),
+                    "doctor_id": doctor_id,
+                    "day": rollup_day(start_date),
+                },
+                {"$inc": increments},
+                upsert=True,
+            )
+            for doctor_id, start_date, increments in events
+        ],
+        ordered=False,
+    )
+
+
+def rebuild_pipeline() -> list[dict]:
+    return [
+        {
+            "$project": {
+                # Cancelling blanks doctor_id; the original is kept alongside.
+                "doctor_id": {
+                    "$cond": [
+                        {"$in": ["$doctor_id", ["", None]]},
+                        "$cancelled_doctor_id",
+                        "$doctor_id",
+                    ]
+                },
+                "day": {"$dateTrunc": {"date": {"$toDate": "$start_date"}, "unit": "day"}},
+                "cancelled": {"$cond": [{"$eq": ["$cancelled", True]}, 1, 0]},
+                "completed": {"$cond": [{"$eq": ["$status", "Completed"]}, 1, 0]},
+                "razorpay_payment_id": 1,
+            }
+        },
+        {"$match": {"doctor_id": {"$nin": ["", None]}, "day": {"$ne": None}}},
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "doctor_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"hospital_id": 1}}],
+                "as": "doctor",
+            }
+        },
+        {
+            "$lookup": {
+                "from": "payment_links",
+                "localField": "razorpay_payment_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"payload.amount_paid": 1}}],
+                "as": "payment_link",
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "hospital_id": {"$ifNull": [{"$first": "$doctor.hospital_id"}, ""]},
+                    "doctor_id": "$doctor_id",
+                    "day": "$day",
+                },
+                "booked": {"$sum": 1},
+                "cancelled": {"$sum": "$cancelled"},
+                "completed": {"$sum": "$completed"},
+                "paid_amount": {
+                    "$sum": {"$ifNull": [{"$first": "$payment_link.payload.amount_paid"}, 0]}
+                },
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "hospital_id": "$_id.hospital_id",
+                "doctor_id": "$_id.doctor_id",
+                "day": "$_id.day",
+                "booked": 1,
+                "cancelled": 1,
+                "completed": 1,
+                "paid_amount": 1,
+            }
+        },
+        {"$out": "rollups"},
+    ]
+
+
+async def rebuild_rollups():
+    # $out swaps the collection in atomically and keeps its indexes.
+    await database["appointments"].aggregate(rebuild_pipeline()).to_list(None)
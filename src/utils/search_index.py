@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+import os
+import re
+from collections import defaultdict
+
+from src.app import database
+
+FIELDS = ("first_name", "last_name", "specialization", "department")
+NAME_FIELDS = ("first_name", "last_name")
+FIELD_WEIGHTS = {"first_name": 3.0, "last_name": 3.0, "specialization": 2.0, "department": 1.0}
+
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+# Minimum trigram Jaccard similarity for a fuzzy match.
+FUZZY_THRESHOLD = 0.4
+# Reload from Mongo this often to pick up writes handled by other workers.
+DOCTOR_INDEX_REFRESH = int(os.getenv("DOCTOR_INDEX_REFRESH", 300))
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str | None) -> list[str]:
+    return TOKEN_PATTERN.findall(text.casefold()) if text else []
+
+
+def trigrams(token: str) -> set[str]:
+    padded = f"${token}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class DoctorIndex:
+    """In-process token and trigram index over active doctors.
+
+    Postings map each token to the doctors and fields it occurs in; the sorted
+    vocabulary serves prefix lookups and the trigram map fuzzy ones, so a
+    search never touches Mongo.
+    """
+
+    def __init__(self):
+        self._documents: dict[str, dict] = {}
+        self._postings: dict[str, dict[str, set[str]]] = defaultdict(dict)
+        self._trigrams: dict[str, set[str]] = defaultdict(set)
+        self._vocabulary: list[str] = []
+        # doctor_id -> (sum of stars, number of reviews)
+        self._ratings: dict[str, tuple[int, int]] = {}
+        self._dirty = False
+        self._task: asyncio.Task | None = None
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def get(self, doctor_id: str) -> dict | None:
+        return self._documents.get(doctor_id)
+
+    def documents(self) -> list[dict]:
+        return list(self._documents.values())
+
+    def rating(self, doctor_id: str) -> float | None:
+        total, count = self._ratings.get(doctor_id, (0, 0))
+        return total / count if count else None
+
+    def add_review(self, doctor_id: str, stars: int):
+        total, count = self._ratings.get(doctor_id, (0, 0))
+        self._ratings[doctor_id] = (total + stars, count + 1)
+
+    def add(self, document: dict):
+        doctor_id = str(document["_id"])
+        if self._documents.get(doctor_id) == document:
+            return
+        self.remove(doctor_id)
+        if document.get("role") != "doctor" or not document.get("active", True):
+            return
+
+        self._documents[doctor_id] = document
+        for field in FIELDS:
+            for token in tokenize(document.get(field)):
+                postings = self._postings[token]
+                if not postings:
+                    for trigram in trigrams(token):
+                        self._trigrams[trigram].add(token)
+                    self._dirty = True
+                postings.setdefault(doctor_id, set()).add(field)
+        self.version += 1
+
+    def remove(self, doctor_id: str):
+        document = self._documents.pop(doctor_id, None)
+        if document is None:
+            return
+
+        for field in FIELDS:
+            for token in tokenize(document.get(field)):
+                postings = self._postings.get(token)
+                if postings is None or postings.pop(doctor_id, None) is None:
+                    continue
+                if not postings:
+                    del self._postings[token]
+                    for trigram in trigrams(token):
+                        self._trigrams[trigram].discard(token)
+                        if not self._trigrams[trigram]:
+                            del self._trigrams[trigram]
+                    self._dirty = True
+        self.version += 1
+
+    def load(self, documents: list[dict], ratings: dict[str, tuple[int, int]] | None = None):
+        fresh = DoctorIndex()
+        for document in documents:
+            fresh.add(document)
+
+        if ratings is not None:
+            self._ratings = ratings
+        # `version` keys caches of derived results (the symptom matches), so a
+        # periodic refresh that finds the same roster must leave it alone.
+        if fresh._documents == self._documents:
+            return
+
+        self._documents = fresh._documents
+        self._postings = fresh._postings
+        self._trigrams = fresh._trigrams
+        self._dirty = True
+        self.version += 1
+
+    def _matches(self, term: str) -> dict[str, float]:
+        """Indexed tokens matching a query term, with their match quality."""
+        if self._dirty:
+            self._vocabulary = sorted(self._postings)
+            self._dirty = False
+
+        matches = {}
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            matches[token] = EXACT_SCORE if token == term else PREFIX_SCORE
+
+        if len(term) >= 3:
+            grams = trigrams(term)
+            shared: dict[str, int] = defaultdict(int)
+            for trigram in grams:
+                for token in self._trigrams.get(trigram, ()):
+                    shared[token] += 1
+            for token, count in shared.items():
+                similarity = count / (len(grams) + len(trigrams(token)) - count)
+                if similarity >= FUZZY_THRESHOLD and token not in matches:
+                    matches[token] = FUZZY_SCORE * similarity
+        return matches
+
+    def search(
+        self, query: str, fields: tuple[str, ...] = FIELDS, limit: int | None = None
+    ) -> list[tuple[float, dict]]:
+        """Doctors matching every query term in `fields`, best first."""
+        scores: dict[str, float] | None = None
+        for term in dict.fromkeys(tokenize(query)):
+            term_scores: dict[str, float] = {}
+            for token, quality in self._matches(term).items():
+                for doctor_id, found_in in self._postings[token].items():
+                    weight = max((FIELD_WEIGHTS[f] for f in found_in if f in fields), default=0)
+                    if weight:
+                        score = quality * weight
+                        if score > term_scores.get(doctor_id, 0):
+                            term_scores[doctor_id] = score
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+            if not scores:
+                return []
+
+        if scores is None:
+            return []
+
+        def rank(item):
+            return -item[1], self._documents[item[0]].get("first_name", "")
+
+        if limit is None:
+            ranked = sorted(scores.items(), key=rank)
+        else:
+            ranked = heapq.nsmallest(limit, scores.items(), key=rank)
+        return [(score, self._documents[doctor_id]) for doctor_id, score in ranked]
+
+    def available_hospitals(self) -> dict[str, int]:
+        """Hospital id -> number of active doctors not on leave."""
+        counts: dict[str, int] = defaultdict(int)
+        for document in self._documents.values():
+            if document.get("hospital_id") and not document.get("on_leave"):
+                counts[document["hospital_id"]] += 1
+        return counts
+
+    def query(
+        self,
+        text: str = "",
+        *,
+        hospital_id: str | None = None,
+        hospital_ids: set[str] | None = None,
+        specialization: str | None = None,
+        department: str | None = None,
+        min_rating: float | None = None,
+        min_fee: int | None = None,
+        max_fee: int | None = None,
+        on_leave: bool | None = None,
+    ) -> tuple[list[tuple[float, dict]], dict[str, dict[str, int]]]:
+        """Ranked matches for `text` under the filters, plus facet counts.
+
+        Each facet is counted with every filter applied except its own, so the
+        app can show how many doctors picking another value would return.
+        """
+        if tokenize(text):
+            candidates = self.search(text)
+        else:
+            candidates = sorted(
+                ((0.0, document) for document in self._documents.values()),
+                key=lambda item: (-(self.rating(str(item[1]["_id"])) or 0), item[1].get("first_name", "")),
+            )
+
+        def keep(document: dict) -> bool:
+            if hospital_id is not None and document.get("hospital_id") != hospital_id:
+                return False
+            if hospital_ids is not None and document.get("hospital_id") not in hospital_ids:
+                return False
+            if on_leave is not None and bool(document.get("on_leave")) != on_leave:
+                return False
+            fee = document.get("consultation_fee", 0)
+            if (min_fee is not None and fee < min_fee) or (max_fee is not None and fee > max_fee):
+                return False
+            if min_rating is not None and (self.rating(str(document["_id"])) or 0) < min_rating:
+                return False
+            return True
+
+        def same(value: str | None, wanted: str | None) -> bool:
+            return wanted is None or (value or "").casefold() == wanted.casefold()
+
+        results = []
+        facets: dict[str, dict[str, int]] = {"specialization": defaultdict(int), "department": defaultdict(int)}
+        for score, document in candidates:
+            if not keep(document):
+                continue
+            in_specialization = same(document.get("specialization"), specialization)
+            in_department = same(document.get("department"), department)
+            if in_department and document.get("specialization"):
+                facets["specialization"][document["specialization"]] += 1
+            if in_specialization and document.get("department"):
+                facets["department"][document["department"]] += 1
+            if in_specialization and in_department:
+                results.append((score, document))
+
+        return results, {name: dict(counts) for name, counts in facets.items()}
+
+    async def refresh(self):
+        documents, ratings = await asyncio.gather(
+            database["users"].find({"role": "doctor", "active": True}).to_list(None),
+            database["reviews"].aggregate(
+                [{"$group": {"_id": "$doctor_id", "total": {"$sum": "$stars"}, "count": {"$sum": 1}}}]
+            ).to_list(None),
+        )
+        self.load(documents, {rating["_id"]: (rating["total"], rating["count"]) for rating in ratings})
+
+    async def reload(self, doctor_id: str):
+        document = await database["users"].find_one({"_id": doctor_id})
+        if document is None:
+            self.remove(doctor_id)
+        else:
+            self.add(document)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Doctor index refresh failed: {e}")
+            await asyncio.sleep(DOCTOR_INDEX_REFRESH)
+
+
+doctor_index = DoctorIndex()
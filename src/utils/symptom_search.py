@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import TTLCache
+
+from .search_index import doctor_index, tokenize
+from .symptoms import symptom_matcher
+from .utils import get_doctor_id, is_gibberish
+
+SYMPTOM_WORKERS = int(os.getenv("SYMPTOM_WORKERS", 4))
+SYMPTOM_TIMEOUT = float(os.getenv("SYMPTOM_TIMEOUT", 10))
+SYMPTOM_CACHE_SIZE = int(os.getenv("SYMPTOM_CACHE_SIZE", 1024))
+SYMPTOM_CACHE_TTL = int(os.getenv("SYMPTOM_CACHE_TTL", 3600))
+# Calls waiting for a worker beyond this many fail fast instead of queueing.
+SYMPTOM_QUEUE_LIMIT = int(os.getenv("SYMPTOM_QUEUE_LIMIT", 4 * SYMPTOM_WORKERS))
+
+_executor: ThreadPoolExecutor | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+# (normalized symptom, roster version) -> doctor id, or None for "no match".
+_matches: TTLCache[tuple[str, int], str | None] = TTLCache(SYMPTOM_CACHE_SIZE, SYMPTOM_CACHE_TTL)
+_inflight: dict[tuple[str, int], asyncio.Future] = {}
+_digest: tuple[int, str] = (-1, "")
+
+
+def roster_digest() -> str:
+    """One line per bookable doctor: just what the prompt needs, no passwords."""
+    global _digest
+    if _digest[0] != doctor_index.version:
+        lines = [
+            " | ".join(
+                [
+                    str(doctor["_id"]),
+                    " ".join(filter(None, [doctor.get("first_name"), doctor.get("last_name")])),
+                    doctor.get("specialization", ""),
+                    doctor.get("department", ""),
+                    f"fee {doctor.get('consultation_fee', 0)}",
+                ]
+            )
+            for doctor in doctor_index.documents()
+            if not doctor.get("on_leave")
+        ]
+        _digest = (doctor_index.version, "\n".join(lines))
+    return _digest[1]
+
+
+class SymptomMatchUnavailable(Exception):
+    pass
+
+
+async def _ask(symptom: str, digest: str) -> str | None:
+    global _executor, _semaphore
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SYMPTOM_WORKERS)
+        _semaphore = asyncio.Semaphore(SYMPTOM_QUEUE_LIMIT)
+
+    if _semaphore.locked():
+        raise SymptomMatchUnavailable("Too many symptom searches in progress")
+
+    await _semaphore.acquire()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(_executor, get_doctor_id, symptom, digest)
+    except BaseException:
+        _semaphore.release()
+        raise
+    # Released when the thread finishes, not when we stop waiting, so calls
+    # that timed out keep counting against the cap until Gemini returns.
+    future.add_done_callback(_release)
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), SYMPTOM_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise SymptomMatchUnavailable("Symptom search timed out")
+
+
+def _release(future: asyncio.Future):
+    _semaphore.release()
+    if not future.cancelled():
+        future.exception()  # abandoned calls may fail; don't log them as unretrieved
+
+
+def local_match(symptom: str) -> str | None:
+    """Best-rated, then cheapest, doctor for a confidently matched specialization."""
+    matched = symptom_matcher.match(symptom)
+    if matched is None:
+        return None
+
+    specialization, _ = matched
+    doctors = [
+        doctor
+        for doctor in doctor_index.documents()
+        if not doctor.get("on_leave")
+        and symptom_matcher.covers(specialization, doctor.get("specialization", ""))
+    ]
+    if not doctors:
+        return None
+
+    best = max(
+        doctors,
+        key=lambda doctor: (
+            doctor_index.rating(str(doctor["_id"])) or 0,
+            -doctor.get("consultation_fee", 0),
+        ),
+    )
+    return str(best["_id"])
+
+
+async def match_doctor(symptom: str) -> str | None:
+    if is_gibberish(symptom):
+        return None
+
+    # The offline matcher answers the common cases; the LLM only sees the rest.
+    doctor_id = local_match(symptom)
+    if doctor_id is not None:
+        return doctor_id
+
+    key = (" ".join(tokenize(symptom)), doctor_index.version)
+    if key in _matches:
+        return _matches[key]
+
+    # Identical symptoms arriving together share one model call.
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = _inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        doctor_id = await _ask(symptom, roster_digest())
+    except Exception as e:
+        pending.set_exception(e)
+        pending.exception()  # waiters re-raise; don't warn if there are none
+        raise
+    except BaseException:
+        pending.cancel()
+        raise
+    else:
+        if doctor_id is not None and doctor_index.get(doctor_id) is None:
+            doctor_id = None
+        _matches[key] = doctor_id
+        pending.set_result(doctor_id)
+        return doctor_id
+    finally:
+        _inflight.pop(key, None)
+
+
+def shutdown_symptom_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
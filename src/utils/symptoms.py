@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import math
+import os
+import re
+
+import numpy as np
+
+# Specialization -> (prefixes recognising it in a doctor's free-text
+# specialization, comma-separated symptom vocabulary). Multi-word phrases are
+# matched as bigrams too, so "chest pain" outweighs "pain" on its own.
+SPECIALIZATIONS: dict[str, tuple[tuple[str, ...], str]] = {
+    "Cardiology": (
+        ("cardio", "heart"),
+        "chest pain, chest tightness, palpitations, heart, heartbeat, irregular heartbeat, "
+        "high blood pressure, hypertension, breathlessness on exertion, swollen ankles, fainting",
+    ),
+    "Dermatology": (
+        ("derma", "skin"),
+        "skin, rash, skin rash, itching, itchy skin, acne, pimples, eczema, psoriasis, hives, "
+        "hair loss, dandruff, mole, wart, blister, pigmentation, nail infection",
+    ),
+    "Neurology": (
+        ("neuro",),
+        "headache, migraine, seizure, fits, numbness, tingling, dizziness, vertigo, tremor, "
+        "memory loss, weakness in limbs, paralysis, stroke, fainting",
+    ),
+    "Orthopedics": (
+        ("ortho", "bone"),
+        "joint pain, knee pain, back pain, lower back pain, neck pain, shoulder pain, fracture, "
+        "sprain, bone, bones, swelling joint, stiffness, arthritis, sports injury",
+    ),
+    "Gastroenterology": (
+        ("gastro",),
+        "stomach, stomach pain, abdominal pain, acidity, heartburn, indigestion, vomiting, "
+        "nausea, diarrhea, constipation, bloating, gas, blood in stool, jaundice",
+    ),
+    "Pulmonology": (
+        ("pulmo", "chest", "respir"),
+        "cough, persistent cough, breathing difficulty, shortness of breath, wheezing, asthma, "
+        "chest congestion, phlegm, sputum, lungs",
+    ),
+    "ENT": (
+        ("ent", "otolaryng", "otorhino"),
+        "ear, ear pain, hearing loss, ringing in ears, sore throat, throat, tonsils, sinus, "
+        "blocked nose, nosebleed, hoarse voice",
+    ),
+    "Ophthalmology": (
+        ("ophthal", "eye"),
+        "eye, eyes, eye pain, red eyes, blurred vision, vision, itchy eyes, watery eyes, "
+        "double vision, cataract",
+    ),
+    "Psychiatry": (
+        ("psych",),
+        "anxiety, depression, stress, insomnia, sleeplessness, panic attacks, mood swings, "
+        "hallucinations, addiction, suicidal thoughts",
+    ),
+    "Pediatrics": (
+        ("pediat", "paediat", "child"),
+        "child, baby, infant, newborn, toddler, kid, vaccination",
+    ),
+    "Gynecology": (
+        ("gyn", "obstet"),
+        "period, periods, irregular periods, menstrual pain, pregnancy, pregnant, "
+        "vaginal discharge, pelvic pain, menopause, pcos",
+    ),
+    "Urology": (
+        ("uro",),
+        "urine, burning urination, frequent urination, blood in urine, kidney stone, "
+        "bladder, prostate",
+    ),
+    "Endocrinology": (
+        ("endocrin", "diabet"),
+        "diabetes, blood sugar, thyroid, weight gain, excessive thirst, hormonal imbalance",
+    ),
+    "Dentistry": (
+        ("dent",),
+        "tooth, teeth, toothache, gums, bleeding gums, cavity, jaw pain",
+    ),
+    "General Medicine": (
+        ("general", "physician", "internal", "family"),
+        "fever, cold, flu, fatigue, tiredness, body ache, weakness, chills, common cold, viral",
+    ),
+}
+
+# Share of the query's weight the best specialization must explain, and its
+# lead over the runner-up, before the local answer is trusted over the LLM.
+SYMPTOM_MATCH_THRESHOLD = float(os.getenv("SYMPTOM_MATCH_THRESHOLD", 0.5))
+SYMPTOM_MATCH_MARGIN = float(os.getenv("SYMPTOM_MATCH_MARGIN", 0.15))
+# Weight of a query word no specialization knows; it dilutes confidence.
+UNKNOWN_WEIGHT = 1.0
+
+STOPWORDS = frozenset(
+    "a about after and am an any are as at be been bad before but by can day days "
+    "do doctor feel feeling for from get getting got had has have having he her his "
+    "i im in is it its last lot me my of on or really severe since she some "
+    "that the there this to too very want was week weeks with".split()
+)
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+def terms(text: str) -> list[str]:
+    words = [
+        word.removesuffix("s") if len(word) > 3 else word
+        for word in WORD_PATTERN.findall(text.lower())
+        if word not in STOPWORDS
+    ]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SymptomMatcher:
+    """TF-IDF keyword model over each specialization's symptom vocabulary.
+
+    A query is scored against every specialization with one matrix-vector
+    product: the share of its TF-IDF weight that the specialization's
+    vocabulary covers.
+    """
+
+    def __init__(self, specializations: dict[str, tuple[tuple[str, ...], str]]):
+        self.names = list(specializations)
+        self.prefixes = [prefixes for prefixes, _ in specializations.values()]
+
+        documents = [
+            {term for phrase in vocabulary.split(",") for term in terms(phrase)}
+            for _, vocabulary in specializations.values()
+        ]
+        self.vocabulary = {term: i for i, term in enumerate(sorted(set().union(*documents)))}
+        self.idf = np.array(
+            [
+                math.log(len(documents) / sum(term in document for document in documents)) + 1
+                for term in self.vocabulary
+            ]
+        )
+
+        self.matrix = np.zeros((len(documents), len(self.vocabulary)))
+        for row, document in enumerate(documents):
+            for term in document:
+                self.matrix[row, self.vocabulary[term]] = 1.0
+
+    def scores(self, text: str) -> np.ndarray:
+        query = np.zeros(len(self.vocabulary))
+        unknown = 0.0
+        for term in terms(text):
+            index = self.vocabulary.get(term)
+            if index is not None:
+                query[index] += 1.0
+            elif " " not in term:
+                unknown += UNKNOWN_WEIGHT
+
+        query *= self.idf
+        total = query.sum() + unknown
+        if not total:
+            return np.zeros(len(self.names))
+        return self.matrix @ query / total
+
+    def match(self, text: str) -> tuple[str, float] | None:
+        """The specialization for `text` and its score, or None when unsure."""
+        scores = self.scores(text)
+        order = np.argsort(scores)[::-1]
+        best, runner_up = scores[order[0]], scores[order[1]]
+        if best < SYMPTOM_MATCH_THRESHOLD or best - runner_up < SYMPTOM_MATCH_MARGIN:
+            return None
+        return self.names[order[0]], float(best)
+
+    def covers(self, specialization: str, doctor_specialization: str) -> bool:
+        """Whether a doctor's free-text specialization falls under `specialization`."""
+        prefixes = self.prefixes[self.names.index(specialization)]
+        return any(word.startswith(prefixes) for word in WORD_PATTERN.findall(doctor_specialization.lower()))
+
+
+symptom_matcher = SymptomMatcher(SPECIALIZATIONS)
@@ -15,8 +15,32 @@ with open("src/utils/prompt.txt") as file:
     prompt = file.read()
 
 
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+CONSONANT_RUN = re.compile(r"[bcdfghjklmnpqrstvwxz]{5,}")
+REPEATED_CHARACTER = re.compile(r"(.)\1\1")
+
+
 def is_gibberish(phrase, threshold: float = 0.7):
-    return False
+    """Whether at least `threshold` of the words look like keyboard mashing.
+
+    Only Latin-script words are judged; anything else (symptoms may come in
+    other languages) is given the benefit of the doubt.
+    """
+    words = WORD_PATTERN.findall(phrase.lower())
+    if not words:
+        return True
+
+    def implausible(word: str) -> bool:
+        if not word.isascii() or len(word) < 4:
+            return False
+        return (
+            len(word) > 25
+            or not any(vowel in word for vowel in "aeiouy")
+            or CONSONANT_RUN.search(word) is not None
+            or REPEATED_CHARACTER.search(word) is not None
+        )
+
+    return sum(map(implausible, words)) / len(words) >= threshold
 
 
 client = genai.Client(api_key=GEMINI_KEY)